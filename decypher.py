@@ -1,40 +1,31 @@
 
+import dvdpy.archive
 import dvdpy.lfsr
-import dvdpy.ecma_267
+import dvdpy.raw
 
-def decode(values, cypher):
+def decode(values, seed):
 
-    decoded = []
-    for b in range(2048):
-        decoded.append(values[12 + b] ^ cypher[b])
-    decoded = values[:12] + bytes(decoded)
-
-    data_edc = dvdpy.ecma_267.calc_edc(decoded)
-    disc_edc = int.from_bytes(values[-4:], 'big')
-    if data_edc != disc_edc:
+    sector = dvdpy.raw.raw_sector(bytearray(values))
+    sector.descramble(seed)
+    if not sector.valid():
         raise ValueError("Bad EDC")
 
-    return decoded + values[-4:]
+    return bytes(sector.view)
 
-f = open("test.bin", "rb")
+# test.bin may also be compressed with dvdpy.archive.compress_image()
+f = dvdpy.archive.open_image("test.bin")
 
 # first sector
 sector0 = f.read(2064)
 
-cypher = None
-for seed in range(0, 0x7FFF): 
-    cypher = dvdpy.lfsr.generate_cypher(seed, 2048)
-
-    try:
-        decode(sector0, cypher)
-        print("Seed is %x" % seed)
-        break
-    except ValueError:
-        continue
+seed = dvdpy.lfsr.recover_seed(sector0)
+if seed is None:
+    raise ValueError("Bad EDC")
+print("Seed is %x" % seed)
 
 f.seek(0)
 for i in range(16):
-    data = decode(f.read(2064), cypher)
+    data = decode(f.read(2064), seed)
     for j in range(20):
         print(" %02x" % data[j], end='')
     print()
@@ -0,0 +1,257 @@
+# Copyright (C) 2025     Josh Wood
+# 
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+# Benchmarks for the descramble, EDC and dump hot paths. Results are
+# printed (and optionally written) as JSON so runs from different commits
+# can be compared with --compare.
+
+import os
+import json
+import time
+import argparse
+import platform
+import tempfile
+import subprocess
+
+import dvdpy
+import dvdpy.archive
+import dvdpy.ecma_267
+import dvdpy.devices
+import dvdpy.lfsr
+import dvdpy.raw
+import dvdpy.scheduler
+import dvdpy.transports
+
+RAW = dvdpy.raw.RAW_SECTOR_SIZE
+USER = dvdpy.raw.USER_SIZE
+
+def measure(function, nbyte: int = 0, min_time: float = 0.5, repeat: int = 5):
+    """ Time function, returning the best and median seconds per call and
+    the throughput in MB/s for nbyte bytes per call.
+    """
+    function()
+
+    # find a loop count that runs for about min_time / repeat
+    loops = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(loops):
+            function()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time / repeat or loops >= 1 << 20:
+            break
+        loops *= 2
+
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(loops):
+            function()
+        times.append((time.perf_counter() - start) / loops)
+    times.sort()
+
+    result = {"best": times[0], "median": times[len(times) // 2], "loops": loops}
+    if nbyte:
+        result["mb_per_s"] = nbyte / times[0] / 1e6
+    return result
+
+def make_sector(sector: int, data: bytes, seed: int):
+    """ Build a scrambled raw sector for user sector with a valid ID, IED and EDC """
+    id_bytes = (sector + dvdpy.scheduler.PSN_OFFSET).to_bytes(4, 'big')
+    header = id_bytes + dvdpy.ecma_267.calc_ied(id_bytes).to_bytes(2, 'big') + bytes(6)
+    edc = dvdpy.ecma_267.calc_edc_fast(header + data)
+    cypher = dvdpy.lfsr.get_cypher(seed)
+    scrambled = (int.from_bytes(data, 'big') ^ int.from_bytes(cypher, 'big')).to_bytes(USER, 'big')
+    return header + scrambled + edc.to_bytes(4, 'big')
+
+def make_capture(path: str, sectors: int):
+    """ Write a synthetic scrambled capture, one seed per 16 sector block """
+    with open(path, "wb") as f:
+        for sector in range(sectors):
+            f.write(make_sector(sector, os.urandom(USER), 1 + (sector >> 4) % 0x7FFF))
+
+def first_sector(path: str):
+    with open(path, "rb") as f:
+        return dvdpy.raw.raw_sector(bytearray(f.read(RAW))).sector_number - dvdpy.scheduler.PSN_OFFSET
+
+def bench_keystream(args):
+    seeds = list(range(1, 257))
+    results = {
+        "reference": measure(lambda: dvdpy.lfsr.generate_cypher(0x1234, USER), USER, args.min_time),
+        "fast": measure(lambda: dvdpy.lfsr.generate_cypher_fast(0x1234, USER), USER, args.min_time),
+        "many_256": measure(lambda: dvdpy.lfsr.generate_cyphers(seeds, USER), 256 * USER, args.min_time),
+    }
+    dvdpy.lfsr.get_cypher(0x1234)
+    results["cached"] = measure(lambda: dvdpy.lfsr.get_cypher(0x1234), USER, args.min_time)
+    return results
+
+def bench_edc(args, capture):
+    sector = capture[:RAW - 4]
+    block = capture[:16 * RAW]
+    cache = (capture * (80 * RAW // len(capture) + 1))[:80 * RAW]
+    return {
+        "reference": measure(lambda: dvdpy.ecma_267.calc_edc(sector), len(sector), args.min_time),
+        "fast": measure(lambda: dvdpy.ecma_267.calc_edc_fast(sector), len(sector), args.min_time),
+        "many_16": measure(lambda: dvdpy.ecma_267.calc_edc_many(block, 16), len(block), args.min_time),
+        "many_80": measure(lambda: dvdpy.ecma_267.calc_edc_many(cache, 80), len(cache), args.min_time),
+    }
+
+def bench_seed(args, capture):
+    start = time.perf_counter()
+    dvdpy.lfsr.seed_index.cache_clear()
+    dvdpy.lfsr.seed_index()
+    build = time.perf_counter() - start
+
+    sector = capture[:RAW]
+    return {
+        "index_build": build,
+        "recover": measure(lambda: dvdpy.lfsr.recover_seed(sector), RAW, args.min_time),
+    }
+
+def bench_decode(args, capture):
+    block = bytes(capture[:16 * RAW])
+    count = len(block) // RAW
+
+    def decode():
+        view = dvdpy.raw.raw_block(bytearray(block), count)
+        seed = view.recover_seed()
+        view.descramble(seed)
+        view.valid()
+        return view.user_data()
+
+    return {"block": measure(decode, count * USER, args.min_time)}
+
+def bench_archive(args, capture):
+    """ Compress an image of zero, repeated and scrambled blocks ending in
+    a short zero block, then time reading it back. Every read is checked,
+    including a full zero block read after the short one.
+    """
+    bs = dvdpy.archive.BLOCK_SIZE
+    data = bytes(bs) + bytes(capture[:bs]) * 2 + bytes(capture[bs:2 * bs]) + bytes(1000)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        source, path = os.path.join(tmp, "image.iso"), os.path.join(tmp, "image.dvz")
+        with open(source, "wb") as f:
+            f.write(data)
+        start = time.perf_counter()
+        stats = dvdpy.archive.compress_image(source, path)
+        compress = time.perf_counter() - start
+
+        with dvdpy.archive.open_image(path) as reader:
+            for offset, n in ((4 * bs, bs), (0, bs), (bs - 10, 20), (0, len(data))):
+                reader.seek(offset)
+                if reader.read(n) != data[offset:offset + n]:
+                    raise RuntimeError(f"compressed image read of {n} bytes at {offset} is wrong")
+
+            def read():
+                reader.seek(0)
+                return reader.read()
+
+            return {"compress_s": compress, "ratio": stats["compressed"] / len(data),
+                    "read": measure(read, len(data), args.min_time)}
+
+def bench_dump(args, path):
+    sectors = os.path.getsize(path) // RAW
+    first = first_sector(path)
+    transport = dvdpy.transports.simulated_transport(path, first_sector=first, latency=args.latency,
+                                                     read_ahead=args.read_ahead)
+    drive = dvdpy.devices.dvd(transport=transport)
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for _ in range(args.repeat):
+            # resume=False so every repeat reads the whole disc again
+            stats = drive.dump(os.path.join(tmp, "image.iso"), first, first + sectors, resume=False)
+            results.append(stats.mb_per_s())
+
+    results.sort()
+    return {"sectors": sectors, "latency": args.latency, "best_mb_per_s": results[-1],
+            "median_mb_per_s": results[len(results) // 2], "bad_sectors": len(stats.bad_sectors)}
+
+def flatten(results, prefix=""):
+    flat = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, prefix + key + "."))
+        else:
+            flat[prefix + key] = value
+    return flat
+
+def compare(old, new):
+    """ Print the change of every throughput and timing shared by two runs """
+    old, new = flatten(old["results"]), flatten(new["results"])
+    for key in sorted(set(old) & set(new)):
+        if key.endswith("mb_per_s") or key.endswith("best") or key.endswith("index_build"):
+            if old[key]:
+                print("%-40s %12.4g -> %12.4g (%+.1f%%)" % (key, old[key], new[key], 100 * (new[key] / old[key] - 1)))
+
+def commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        return ""
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        "python3 " + os.path.basename(__file__),
+        description="Benchmarks for the descramble, EDC and dump hot paths")
+    parser.add_argument("-c", "--capture", help="Raw cache capture to replay (e.g. test.bin written by test.py)")
+    parser.add_argument("-s", "--sectors", type=int, default=1024, help="Sectors in the synthetic capture (default 1024)")
+    parser.add_argument("-o", "--output", help="Write the JSON results to this file")
+    parser.add_argument("--compare", help="JSON results of an earlier run to compare against")
+    parser.add_argument("--min-time", type=float, default=0.5, help="Seconds spent timing each benchmark (default 0.5)")
+    parser.add_argument("--latency", type=float, default=0.0, help="Simulated drive latency per command (default 0)")
+    parser.add_argument("--read-ahead", type=int, default=16, help="Simulated drive read ahead in sectors (default 16)")
+    parser.add_argument("--repeat", type=int, default=3, help="Number of end-to-end dumps (default 3)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.capture
+        if path is None:
+            path = os.path.join(tmp, "capture.bin")
+            make_capture(path, args.sectors)
+
+        with open(path, "rb") as f:
+            capture = f.read()
+
+        results = {
+            "keystream": bench_keystream(args),
+            "edc": bench_edc(args, capture),
+            "seed": bench_seed(args, capture),
+            "decode": bench_decode(args, capture),
+            "archive": bench_archive(args, capture),
+            "dump": bench_dump(args, path),
+        }
+
+    run = {
+        "version": dvdpy.__version__,
+        "commit": commit(),
+        "python": platform.python_version(),
+        "numpy": dvdpy.raw.numpy is not None,
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "results": results,
+    }
+
+    text = json.dumps(run, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), run)
@@ -0,0 +1,317 @@
+# Copyright (C) 2025     Josh Wood
+# 
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+# Compressed image made of independently compressed blocks (16 sectors
+# by default) so any block can be read without decompressing the ones
+# before it.
+#
+#     header: magic, version, block size, image size, index offset
+#     data:   compressed blocks
+#     index:  kind, offset and length of every block
+#
+# Blocks of zeros take no space at all and a block repeating an earlier
+# one points at the data already stored. The blocks are compressed in a
+# process pool, the index is written last when the writer is closed.
+
+import hashlib
+import io
+import os
+import struct
+import zlib
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from . import commands
+
+MAGIC = b"DVDPYCMP"
+VERSION = 1
+HEADER = struct.Struct("<8sHIqq")
+RECORD = struct.Struct("<BqI")
+
+ZERO = 0
+STORED = 1
+DEFLATE = 2
+
+BLOCK_SIZE = commands.SECTORS_PER_BLOCK * commands.SECTOR_SIZE
+
+def _compress(data: bytes, level: int):
+    return zlib.compress(data, level)
+
+def _decompress(kind: int, data: bytes, size: int):
+    if kind == ZERO:
+        return bytes(size)
+    if kind == DEFLATE:
+        return zlib.decompress(data)
+    return data
+
+class compressed_writer:
+    """ Writes a compressed image one block at a time
+
+    Parameters:
+        path (str): path of the compressed image
+        size (int): size of the uncompressed image in bytes
+        block_size (int): bytes per block, e.g. 16 * 2064 for raw sectors
+        level (int): zlib compression level
+        executor (concurrent.futures.Executor): runs the compression,
+            defaults to a ProcessPoolExecutor owned by the writer
+    """
+    def __init__(self, path: str, size: int, block_size: int = BLOCK_SIZE,
+                 level: int = 6, executor=None):
+        self.path = path
+        self.size = size
+        self.block_size = block_size
+        self.level = level
+        self.blocks = (size + block_size - 1) // block_size
+        self.owns_executor = executor is None
+        self.executor = ProcessPoolExecutor() if executor is None else executor
+        self.depth = 4 * (getattr(self.executor, "_max_workers", None) or os.cpu_count() or 1)
+        self.records = []
+        self.seen = {}
+        self.pending = deque()
+        self.written = 0
+        self.stored_bytes = 0
+        self.file = open(path, "wb")
+        self.file.write(HEADER.pack(MAGIC, VERSION, block_size, size, 0))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def write_block(self, data):
+        """ Add the next block, only the last block may be short """
+        if self.written >= self.blocks:
+            raise ValueError("image already holds every block")
+        expected = min(self.block_size, self.size - self.written * self.block_size)
+        if len(data) != expected:
+            raise ValueError(f"block {self.written} must be {expected} bytes")
+        data = bytes(data)
+        self.written += 1
+
+        if data.count(0) == len(data):
+            self.pending.append((ZERO, None, None))
+        else:
+            digest = hashlib.sha1(data).digest()
+            if digest in self.seen:
+                self.pending.append((None, digest, None))
+            else:
+                self.seen[digest] = None
+                self.pending.append((DEFLATE, digest, (data, self.executor.submit(_compress, data, self.level))))
+
+        while self.pending and (len(self.pending) > self.depth or self._ready()):
+            self._store(*self.pending.popleft())
+
+    def _ready(self):
+        kind, digest, work = self.pending[0]
+        return work is None or work[1].done()
+
+    def _store(self, kind, digest, work):
+        # blocks are stored in order so a repeat always follows its original
+        if kind == ZERO:
+            self.records.append((ZERO, 0, 0))
+        elif work is None:
+            self.records.append(self.seen[digest])
+        else:
+            data, future = work
+            compressed = future.result()
+            if len(compressed) >= len(data):
+                kind, compressed = STORED, data
+            record = (kind, self.file.tell(), len(compressed))
+            self.file.write(compressed)
+            self.stored_bytes += len(compressed)
+            self.seen[digest] = record
+            self.records.append(record)
+
+    def close(self):
+        if self.file is None:
+            return
+        try:
+            while self.pending:
+                self._store(*self.pending.popleft())
+            if len(self.records) != self.blocks:
+                raise ValueError(f"image closed after {len(self.records)} of {self.blocks} blocks")
+
+            index_offset = self.file.tell()
+            for record in self.records:
+                self.file.write(RECORD.pack(*record))
+            self.file.seek(0)
+            self.file.write(HEADER.pack(MAGIC, VERSION, self.block_size, self.size, index_offset))
+        finally:
+            self.file.close()
+            self.file = None
+            if self.owns_executor:
+                self.executor.shutdown()
+
+class compressed_reader(io.RawIOBase):
+    """ Random access, file-like view of a compressed image.
+
+    Blocks are decompressed on demand into a small LRU cache, shared by
+    blocks that were deduplicated. Sequential reads decompress the next
+    read_ahead blocks in worker threads (zlib releases the GIL).
+
+    Parameters:
+        path (str): path of the compressed image
+        cache_blocks (int): number of decompressed blocks kept
+        read_ahead (int): blocks decompressed ahead of sequential reads
+    """
+    def __init__(self, path: str, cache_blocks: int = 16, read_ahead: int = 4):
+        super().__init__()
+        self.path = path
+        self.fd = os.open(path, os.O_RDONLY)
+        magic, version, self.block_size, self.size, index_offset = HEADER.unpack(os.pread(self.fd, HEADER.size, 0))
+        if magic != MAGIC or version != VERSION or index_offset == 0:
+            os.close(self.fd)
+            raise ValueError(f"{path} is not a compressed image")
+
+        self.blocks = (self.size + self.block_size - 1) // self.block_size
+        table = os.pread(self.fd, self.blocks * RECORD.size, index_offset)
+        self.records = [RECORD.unpack_from(table, i * RECORD.size) for i in range(self.blocks)]
+        self.cache_blocks = max(1, cache_blocks)
+        self.read_ahead = read_ahead
+        self.executor = ThreadPoolExecutor(read_ahead) if read_ahead > 0 else None
+        self.cache = OrderedDict()
+        self.position = 0
+        self.last_block = None
+
+    def close(self):
+        if self.fd is not None:
+            if self.executor is not None:
+                self.executor.shutdown()
+            os.close(self.fd)
+            self.fd = None
+        super().close()
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            position = offset
+        elif whence == io.SEEK_CUR:
+            position = self.position + offset
+        elif whence == io.SEEK_END:
+            position = self.size + offset
+        else:
+            raise ValueError("invalid whence")
+        if position < 0:
+            raise ValueError("negative seek position")
+        self.position = position
+        return position
+
+    def stats(self):
+        """ Returns the number of ZERO, STORED and DEFLATE blocks and the
+        compressed size as a dict
+        """
+        kinds = [0, 0, 0]
+        for kind, offset, length in self.records:
+            kinds[kind] += 1
+        stored = sum(length for kind, offset, length in set(self.records))
+        return {"blocks": self.blocks, "zero": kinds[ZERO], "stored": kinds[STORED],
+                "deflate": kinds[DEFLATE], "unique": len(set(self.records) - {(ZERO, 0, 0)}),
+                "size": self.size, "compressed": stored}
+
+    def _load(self, block: int):
+        kind, offset, length = self.records[block]
+        size = min(self.block_size, self.size - block * self.block_size)
+        return _decompress(kind, os.pread(self.fd, length, offset), size)
+
+    def read_block(self, block: int):
+        """ Returns the uncompressed data of a block """
+        if not 0 <= block < self.blocks:
+            raise IndexError("block out of range")
+
+        # zero blocks share one record but not one size, so they are never cached
+        if self.records[block][0] == ZERO:
+            self.last_block = block
+            return self._load(block)
+
+        # sequential access decompresses the following blocks in the background
+        if self.executor is not None and self.last_block is not None and block == self.last_block + 1:
+            for ahead in range(block + 1, min(block + 1 + self.read_ahead, self.blocks)):
+                if self.records[ahead][0] != ZERO and self.records[ahead] not in self.cache:
+                    self.cache[self.records[ahead]] = self.executor.submit(self._load, ahead)
+        self.last_block = block
+
+        key = self.records[block]
+        data = self.cache.get(key)
+        if data is None:
+            data = self._load(block)
+        elif not isinstance(data, bytes):
+            data = data.result()
+        self.cache[key] = data
+        self.cache.move_to_end(key)
+        while len(self.cache) > self.cache_blocks + self.read_ahead:
+            self.cache.popitem(last=False)
+
+        return data
+
+    def readinto(self, buffer):
+        view = memoryview(buffer).cast('B')
+        n = max(0, min(len(view), self.size - self.position))
+
+        done = 0
+        while done < n:
+            block, offset = divmod(self.position, self.block_size)
+            data = self.read_block(block)
+            chunk = min(n - done, len(data) - offset)
+            if chunk <= 0:
+                raise OSError(f"block {block} of {self.path} is shorter than the index says")
+            view[done:done + chunk] = data[offset:offset + chunk]
+            done += chunk
+            self.position += chunk
+
+        return done
+
+def compress_image(source: str, path: str, block_size: int = BLOCK_SIZE,
+                   level: int = 6, executor=None):
+    """ Compress an image file (user data or raw sectors) block by block
+
+    Args:
+        source (str): path of the image
+        path (str): path of the compressed image
+        block_size (int, optional): bytes per block, 16 * 2064 for raw
+            sector dumps (default: 16 * 2048)
+        level (int, optional): zlib compression level (default: 6)
+        executor (concurrent.futures.Executor, optional): runs the
+            compression (default: a new ProcessPoolExecutor)
+
+    Returns:
+        (dict): see compressed_reader.stats()
+    """
+    size = os.path.getsize(source)
+    with open(source, "rb") as f, compressed_writer(path, size, block_size, level, executor) as writer:
+        for block in range(writer.blocks):
+            writer.write_block(f.read(block_size))
+
+    with compressed_reader(path, read_ahead=0) as reader:
+        return reader.stats()
+
+def open_image(path: str):
+    """ Open an image for reading whether it is compressed or not
+
+    Returns:
+        (file-like): compressed_reader or a regular binary file
+    """
+    with open(path, "rb") as f:
+        compressed = f.read(len(MAGIC)) == MAGIC
+    return compressed_reader(path) if compressed else open(path, "rb")
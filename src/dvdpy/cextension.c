@@ -20,14 +20,25 @@
  * Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
  */
 
+#define PY_SSIZE_T_CLEAN
 #include <Python.h>
 #include <stdio.h>
+#include <stdbool.h>
 #include <string.h>
 #include <unistd.h>
 #include <linux/cdrom.h>
 #include <sys/types.h>
 #include <sys/ioctl.h>
+#include <time.h>
 #include <fcntl.h>
+#include <errno.h>
+#include <scsi/sg.h>
+
+#ifndef SG_FLAG_Q_AT_TAIL
+/* queue at the tail so commands reach the drive in submission order,
+   missing from the glibc copy of <scsi/sg.h> */
+#define SG_FLAG_Q_AT_TAIL 0x10
+#endif
 
 u_int8_t SPC_INQUIRY = 0x12;
 u_int8_t MMC_READ_12 = 0xA8;
@@ -35,8 +46,17 @@ u_int8_t MMC_READ_12 = 0xA8;
 u_int32_t CACHE_SIZE = 80 * 2064;
 u_int32_t HITACHI_MEM_BASE = 0x80000000;
 
+struct command_info {
+    /* Details of a completed command */
+    int sense_key;       /* sense key reported by the drive */
+    int asc;             /* additional sense code */
+    int ascq;            /* additional sense code qualifier */
+    long long latency;   /* time spent in the ioctl in nanoseconds */
+};
+
 int execute_command(int fd, unsigned char *cmd, unsigned char *buffer,
-                    int buflen, int timeout, bool verbose) {
+                    int buflen, bool data_out, int timeout, bool verbose,
+                    struct command_info *info) {
     /* Sends a command to the DVD drive using Linux API
      *
      * Args:
@@ -45,13 +65,17 @@ int execute_command(int fd, unsigned char *cmd, unsigned char *buffer,
      *     buffer (unsigned char *): pointer to the buffer where bytes
      *                               returned by the command are placed
      *     buflen (int): length of the buffer
+     *     data_out (bool): set to true when the buffer is sent to the drive
      *     timeout (int): timeout duration in integer seconds
      *     verbose (bool): set to true to print more details to stdout
+     *     info (struct command_info *): filled with the sense data and
+     *                                   latency when not NULL
      *
      * Returns:
      *     (int): the command status where -1 indicates an error
      */
     struct cdrom_generic_command cgc;
+    struct timespec begin, end;
     struct request_sense sense;
 
     memset(&cgc, 0, sizeof(cgc));
@@ -61,17 +85,25 @@ int execute_command(int fd, unsigned char *cmd, unsigned char *buffer,
     cgc.buffer = buffer;
     cgc.buflen = buflen;
     cgc.sense = &sense;
-    cgc.data_direction = CGC_DATA_READ;
+    cgc.data_direction = data_out ? CGC_DATA_WRITE : CGC_DATA_READ;
     cgc.timeout = timeout * 1000;
 
-    verbose = true;
     if (verbose) {
         printf("Executing MMC command: ");
         for (int i=0; i<6; i++) printf(" %02x%02x", cgc.cmd[2*i], cgc.cmd[2*i+1]);
         printf("\n");
     }
 
+    clock_gettime(CLOCK_MONOTONIC, &begin);
     int status = ioctl(fd, CDROM_SEND_PACKET, &cgc);
+    clock_gettime(CLOCK_MONOTONIC, &end);
+
+    if (info != NULL) {
+        info->sense_key = cgc.sense->sense_key;
+        info->asc = cgc.sense->asc;
+        info->ascq = cgc.sense->ascq;
+        info->latency = (end.tv_sec - begin.tv_sec) * 1000000000LL + (end.tv_nsec - begin.tv_nsec);
+    }
 
     if (verbose)
         printf("Sense data: %02X/%02X/%02X (status %d)\n",
@@ -110,9 +142,69 @@ static PyObject *command_device(PyObject *self, PyObject *args) {
         return (PyObject *) NULL;
     }
 
-    int status = execute_command(fd, (unsigned char *)cmd, (unsigned char *)buffer, buflen, timeout, (bool)verbose);
+    if (buflen < 0 || buflen > (int)CACHE_SIZE) {
+        PyErr_SetString(PyExc_ValueError, "buffer length exceeds the cache size");
+        return (PyObject *) NULL;
+    }
+
+    int status;
+    Py_BEGIN_ALLOW_THREADS
+    status = execute_command(fd, (unsigned char *)cmd, (unsigned char *)buffer, buflen, false, timeout, (bool)verbose, NULL);
+    Py_END_ALLOW_THREADS
 
-    return Py_BuildValue("(OO)", PyLong_FromLong(status), PyBytes_FromStringAndSize(buffer, buflen));
+    return Py_BuildValue("(NN)", PyLong_FromLong(status), PyBytes_FromStringAndSize(buffer, buflen));
+};
+
+static PyObject *command_device_into(PyObject *self, PyObject *args) {
+    /* Python interface for commanding a DVD device that places
+     * the returned bytes directly into a caller supplied buffer.
+     *
+     * Note: the buffer can be any writable contiguous object
+     * supporting the buffer protocol (bytearray, memoryview,
+     * numpy array) and its full length is used as the buffer
+     * length. No copies are made and the GIL is released while
+     * waiting on the drive so other Python threads keep running.
+     *
+     * Args:
+     *     fd (int): the file descriptor of the drive
+     *     cmd (bytearray): pointer to the 12 command bytes
+     *     buffer (writable buffer): output buffer for the returned bytes
+     *     timeout (int): timeout duration in integer seconds
+     *     verbose (bool): set to true to print more details to stdout
+     *     data_out (bool, optional): send the buffer to the drive instead (default: false)
+     *
+     * Returns:
+     *     (tuple): (status, sense key, asc, ascq, latency in nanoseconds)
+     *              where a status of -1 indicates an error
+     */
+    Py_ssize_t cmdlen;
+    int fd, timeout, verbose, data_out = 0;
+    struct command_info info;
+    const char *cmd;
+    Py_buffer buffer;
+    if (!PyArg_ParseTuple(args, "iy#w*ip|p", &fd, &cmd, &cmdlen, &buffer, &timeout, &verbose, &data_out))
+        return NULL;
+
+    if (cmdlen != 12) {
+        PyBuffer_Release(&buffer);
+        PyErr_SetString(PyExc_ValueError, "command length must be 12 bytes");
+        return (PyObject *) NULL;
+    }
+
+    if (buffer.len > INT_MAX) {
+        PyBuffer_Release(&buffer);
+        PyErr_SetString(PyExc_ValueError, "buffer is too large");
+        return (PyObject *) NULL;
+    }
+
+    int status;
+    Py_BEGIN_ALLOW_THREADS
+    status = execute_command(fd, (unsigned char *)cmd, (unsigned char *)buffer.buf, (int)buffer.len, (bool)data_out, timeout, (bool)verbose, &info);
+    Py_END_ALLOW_THREADS
+
+    PyBuffer_Release(&buffer);
+
+    return Py_BuildValue("(iiiiL)", status, info.sense_key, info.asc, info.ascq, info.latency);
 };
 
 static PyObject *open_device(PyObject *self, PyObject *args) {
@@ -149,6 +241,143 @@ static PyObject *close_device(PyObject *self, PyObject *args) {
     return PyLong_FromLong(close(fd));
 };
 
+/*
+ * Queued commands through the Linux sg driver. A command is submitted
+ * by writing an sg_io_hdr to the sg device and completed by reading one
+ * back, so several commands can be in flight at once. The kernel keeps
+ * pointers to the command's data and sense buffers until completion, so
+ * each submitted command owns an sg_request kept alive by a capsule.
+ */
+#define SG_SENSE_SIZE 32
+
+struct sg_request {
+    sg_io_hdr_t hdr;
+    unsigned char cmd[12];
+    unsigned char sense[SG_SENSE_SIZE];
+    Py_buffer buffer;
+};
+
+static void sg_request_free(PyObject *capsule) {
+    struct sg_request *request = PyCapsule_GetPointer(capsule, "dvdpy.sg_request");
+    if (request != NULL) {
+        PyBuffer_Release(&request->buffer);
+        PyMem_Free(request);
+    }
+};
+
+static PyObject *sg_submit(PyObject *self, PyObject *args) {
+    /* Submit a command to an sg device without waiting for it.
+     *
+     * Note: the returned capsule must be kept alive until the
+     * command completes (see sg_receive) because the kernel
+     * writes into the buffer and sense data it holds.
+     *
+     * Args:
+     *     fd (int): file descriptor of the sg device (opened read/write)
+     *     cmd (bytearray): pointer to the 12 command bytes
+     *     buffer (writable buffer): output buffer for the returned bytes
+     *     timeout (int): timeout duration in integer seconds
+     *     pack_id (int): identifier returned by sg_receive on completion
+     *     data_out (bool, optional): send the buffer to the drive instead (default: false)
+     *
+     * Returns:
+     *     (capsule): the in flight request
+     */
+    Py_ssize_t cmdlen;
+    int fd, timeout, pack_id, data_out = 0;
+    const char *cmd;
+    struct sg_request *request = PyMem_Calloc(1, sizeof(struct sg_request));
+    if (request == NULL)
+        return PyErr_NoMemory();
+
+    if (!PyArg_ParseTuple(args, "iy#w*ii|p", &fd, &cmd, &cmdlen, &request->buffer, &timeout, &pack_id, &data_out)) {
+        PyMem_Free(request);
+        return NULL;
+    }
+
+    if (cmdlen != 12 || request->buffer.len > UINT_MAX) {
+        PyBuffer_Release(&request->buffer);
+        PyMem_Free(request);
+        PyErr_SetString(PyExc_ValueError, cmdlen != 12 ? "command length must be 12 bytes" : "buffer is too large");
+        return (PyObject *) NULL;
+    }
+
+    memcpy(request->cmd, cmd, 12);
+    request->hdr.interface_id = 'S';
+    if (request->buffer.len == 0)
+        request->hdr.dxfer_direction = SG_DXFER_NONE;
+    else
+        request->hdr.dxfer_direction = data_out ? SG_DXFER_TO_DEV : SG_DXFER_FROM_DEV;
+    request->hdr.cmd_len = 12;
+    request->hdr.mx_sb_len = SG_SENSE_SIZE;
+    request->hdr.dxfer_len = (unsigned int)request->buffer.len;
+    request->hdr.dxferp = request->buffer.buf;
+    request->hdr.cmdp = request->cmd;
+    request->hdr.sbp = request->sense;
+    request->hdr.timeout = timeout * 1000;
+    request->hdr.pack_id = pack_id;
+    request->hdr.usr_ptr = request;
+    request->hdr.flags = SG_FLAG_Q_AT_TAIL;
+
+    PyObject *capsule = PyCapsule_New(request, "dvdpy.sg_request", sg_request_free);
+    if (capsule == NULL) {
+        PyBuffer_Release(&request->buffer);
+        PyMem_Free(request);
+        return NULL;
+    }
+
+    ssize_t written;
+    Py_BEGIN_ALLOW_THREADS
+    written = write(fd, &request->hdr, sizeof(sg_io_hdr_t));
+    Py_END_ALLOW_THREADS
+
+    if (written < 0) {
+        Py_DECREF(capsule);
+        return PyErr_SetFromErrno(PyExc_OSError);
+    }
+
+    return capsule;
+};
+
+static PyObject *sg_receive(PyObject *self, PyObject *args) {
+    /* Wait for the next command submitted with sg_submit to complete.
+     *
+     * Args:
+     *     fd (int): file descriptor of the sg device
+     *
+     * Returns:
+     *     (tuple): (pack_id, status, sense key, asc, ascq, duration in
+     *              milliseconds) where a status of -1 indicates an error
+     */
+    int fd;
+    sg_io_hdr_t hdr;
+    if (!PyArg_ParseTuple(args, "i", &fd))
+        return NULL;
+
+    memset(&hdr, 0, sizeof(hdr));
+    hdr.interface_id = 'S';
+
+    ssize_t nread;
+    Py_BEGIN_ALLOW_THREADS
+    nread = read(fd, &hdr, sizeof(sg_io_hdr_t));
+    Py_END_ALLOW_THREADS
+
+    if (nread < 0)
+        return PyErr_SetFromErrno(PyExc_OSError);
+
+    struct sg_request *request = hdr.usr_ptr;
+    int sense_key = 0, asc = 0, ascq = 0;
+    if (hdr.sb_len_wr >= 14 && request != NULL) {
+        sense_key = request->sense[2] & 0x0F;
+        asc = request->sense[12];
+        ascq = request->sense[13];
+    }
+
+    int status = (hdr.info & SG_INFO_OK_MASK) == SG_INFO_OK ? 0 : -1;
+
+    return Py_BuildValue("(iiiiii)", hdr.pack_id, status, sense_key, asc, ascq, (int)hdr.duration);
+};
+
 /*
  * Descriptions for the methods available in this module.
  * These can be accessed within Python using `dir(dvdpy.cextension)`
@@ -157,6 +386,9 @@ static PyMethodDef Methods[] = {
     {"open_device",       open_device, METH_VARARGS, "Open the path to a DVD drive."},
     {"close_device",     close_device, METH_VARARGS, "Close the path to a DVD drive."},
     {"command_device", command_device, METH_VARARGS, "Send byte command to a DVD drive."},
+    {"command_device_into", command_device_into, METH_VARARGS, "Send byte command to a DVD drive, filling a writable buffer."},
+    {"sg_submit",           sg_submit, METH_VARARGS, "Submit a command to an sg device without waiting."},
+    {"sg_receive",         sg_receive, METH_VARARGS, "Wait for a submitted sg command to complete."},
     {NULL, NULL, 0, NULL}
 };
 
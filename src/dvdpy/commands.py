@@ -21,6 +21,12 @@
 SPC_INQUIRY    = 0x12
 SBC_START_STOP = 0x1B
 MMC_READ_12    = 0xA8
+MMC_SET_STREAMING = 0xB6
+MMC_SET_CD_SPEED  = 0xBB
+HIT_READ_MEMORY = 0xE7
+
+# commands whose buffer is sent to the drive instead of filled by it
+DATA_OUT_OPCODES = {MMC_SET_STREAMING}
 
 SECTOR_SIZE = 2048
 RAW_SECTOR_SIZE = 2064
@@ -28,25 +34,71 @@ SECTORS_PER_BLOCK = 16
 
 HITACHI_MEM_BASE = 0x80000000
 
+# drive speeds are given in kB/s (1000 bytes), 0xFFFF selects the fastest speed
+DVD_1X_SPEED = 1385
+MAX_SPEED = 0xFFFF
+STREAMING_DESCRIPTOR_SIZE = 28
+
+from collections import namedtuple
 from . import cextension
 
-def drive_info(fd: int, timeout: int = 1, verbose: bool = False):
-    """ Retrieve drive model info
+# status and sense data of a completed command, latency is in seconds
+CommandResult = namedtuple("CommandResult", ["status", "sense_key", "asc", "ascq", "latency"])
+
+def send_command(fd: int, cmd: bytes, buffer, timeout: int = 1, verbose: bool = False):
+    """ Send a 12 byte command to the drive. Returned bytes are placed
+    directly in the writable buffer, whose length sets the transfer size.
+
+    Commands in DATA_OUT_OPCODES send the buffer to the drive instead.
 
     Args:
         fd (int): file descriptor
-        timeout (int): command timeout in seconds
-        verbose (bool): set to True to print more info
+        cmd (bytes): 12 command bytes
+        buffer (writable bytes-like): output buffer
+        timeout (int, optional): command timeout in seconds (default: 1)
+        verbose (bool, optional): set to True to print more info (default: False)
 
     Returns:
-        (str): model string
+        (CommandResult): status, sense key, asc, ascq and latency
     """
-    cmd = bytes([
+    status, sense_key, asc, ascq, latency = cextension.command_device_into(fd, cmd, buffer, timeout, verbose,
+                                                                           cmd[0] in DATA_OUT_OPCODES)
+
+    return CommandResult(status, sense_key, asc, ascq, latency * 1e-9)
+
+def _execute(fd: int, cmd: bytes, buflen: int, timeout: int, verbose: bool, buffer=None):
+    """ Send a command to the drive, returning bytes in a new buffer or
+    in place when a writable buffer is supplied.
+
+    Returns:
+        (int, bytes-like): tuple with (command status, buffer)
+    """
+    if buffer is None:
+        buffer = bytearray(buflen)
+
+    view = memoryview(buffer).cast('B')
+    if len(view) < buflen:
+        raise ValueError(f"buffer too small (need {buflen} bytes)")
+
+    result = send_command(fd, cmd, view[:buflen], timeout, verbose)
+
+    return result.status, buffer
+
+def inquiry_command(nbyte: int = 36):
+    """ Build the command bytes for a model inquiry.
+
+    Args:
+        nbyte (int, optional): return buffer length (default: 36)
+
+    Returns:
+        (bytes): 12 command bytes
+    """
+    return bytes([
         SPC_INQUIRY, #  0. model inquiry command
         0,           #  1. empty
         0,           #  2. empty
         0,           #  3. empty
-        36,          #  4. return buffer length
+        nbyte,       #  4. return buffer length
         0,           #  5. empty
         0,           #  6. empty
         0,           #  7. empty
@@ -56,31 +108,34 @@ def drive_info(fd: int, timeout: int = 1, verbose: bool = False):
         0            # 11. empty
     ])
 
-    status, buffer = cextension.command_device(fd, cmd, cmd[4], timeout, verbose)
+def parse_inquiry(buffer):
+    """ Extract the model string from the inquiry return buffer.
+
+    Args:
+        buffer (bytes-like): 36 bytes returned by the inquiry command
 
-    vendor = buffer[8:16].decode("utf-8")
-    prod_id = buffer[16:32].decode("utf-8")
-    prod_rev = buffer[32:36].decode("utf-8")
+    Returns:
+        (str): model string
+    """
+    vendor = bytes(buffer[8:16]).decode("utf-8")
+    prod_id = bytes(buffer[16:32]).decode("utf-8")
+    prod_rev = bytes(buffer[32:36]).decode("utf-8")
 
     return f"{vendor}/{prod_id}/{prod_rev}"
 
-def drive_spin(fd: int, state: bool, timeout: int = 1, verbose: bool = False):
-    """ Set the drive spin state. A spin state of True indicates the
-    disc is spinning whereas False means the disc is stopped.
+def start_stop_command(state: bool):
+    """ Build the command bytes to set the drive spin state.
 
     Args:
-        fd (int): file descriptor
         state (bool): spin state
-        timeout (int): command timeout in seconds
-        verbose (bool): set to True to print more info
 
     Returns:
-        (int): command status (-1 means fail)
+        (bytes): 12 command bytes
     """
     if isinstance(state, bool) == False:
         raise TypeError("Spin state must be True or False")
 
-    cmd = bytes([
+    return bytes([
         SBC_START_STOP, #  0. start/stop command
         0,              #  1. empty
         0,              #  2. empty
@@ -95,28 +150,18 @@ def drive_spin(fd: int, state: bool, timeout: int = 1, verbose: bool = False):
         0               # 11. empty
     ])
 
-    status, buffer = cextension.command_device(fd, cmd, 8, timeout, verbose)
-
-    return status
-
-def read_sectors(fd: int, sector: int, sectors: int = SECTORS_PER_BLOCK,
-                 streaming: bool = False, timeout: int = 1, verbose: bool = False):
-    """ Read 2048 byte user data sectors from the drive. These do not
-    include the first 12 bytes (ID, IED, CPR_MAI) or last 4 bytes (EDC)
-    found in raw sectors.
+def read_12_command(sector: int, sectors: int = SECTORS_PER_BLOCK, streaming: bool = False):
+    """ Build the command bytes to read 2048 byte user data sectors.
 
     Args:
-        fd (int): file descriptor
         sector (int): starting sector
         sectors (int, optional): number of sectors to read (default: 16)
         streaming (int, optional): use streaming mode when True (default: False)
-        timeout (int, optional): command timeout in seconds (default: 1)
-        verbose (bool, optional): set to True to print more info (default: False)
 
     Returns:
-        (int, bytearray): tuple with (command status, buffer)
+        (bytes): 12 command bytes
     """
-    cmd = bytes([
+    return bytes([
         MMC_READ_12,                  #  0. read command
         0 if streaming else 0x08,     #  1. force unit access bit
         (sector & 0xFF000000) >> 24,  #  2. sector MSB
@@ -131,27 +176,15 @@ def read_sectors(fd: int, sector: int, sectors: int = SECTORS_PER_BLOCK,
         0                             # 11. empty
     ])
 
-    return cextension.command_device(fd, cmd, sectors * SECTOR_SIZE, timeout, verbose)
-
-def read_raw_bytes(fd: int, offset: int, nbyte: int = RAW_SECTOR_SIZE,
-                   timeout: int = 1, verbose: bool = False):
-    """ Reads raw bytes from the drive cache. This cache consists of
-    2064 byte raw sectors with ID, IED, CPR_MAI, USER DATA, and EDC fields.
-
-    Note you must do the following before using this command:
-      1. Execute a read_sectors() command with streaming = True to fill the cache.
-      2. Ensure you're running the command with root privileges.
-         The command will not work with regular user privileges.
+def read_memory_command(offset: int, nbyte: int = RAW_SECTOR_SIZE):
+    """ Build the command bytes to read raw bytes from the drive cache.
 
     Args:
-        fd (int): file descriptor
         offset (int): starting memory offset within cache
         nbyte (int, optional): number of memory bytes to read starting from offset (default: 2064)
-        timeout (int, optional): command timeout in seconds (default: 1)
-        verbose (bool, optional): set to True to print more info (default: False)
 
     Returns:
-        (int, bytearray): tuple with (command status, buffer)
+        (bytes): 12 command bytes
     """
     address = HITACHI_MEM_BASE + offset;
 
@@ -159,8 +192,8 @@ def read_raw_bytes(fd: int, offset: int, nbyte: int = RAW_SECTOR_SIZE,
 	    raise ValueError("invalid nbyte (valid: 1 - 65535)")
 
     # Note: bytes 1-3 = HIT which is likely short for HITACHI
-    cmd = bytes([
-        0xE7,                         #  0. vendor specific command (discovered by DaveX)
+    return bytes([
+        HIT_READ_MEMORY,              #  0. vendor specific command (discovered by DaveX)
         0x48,                         #  1. H
         0x49,                         #  2. I
         0x54,                         #  3. T
@@ -174,4 +207,183 @@ def read_raw_bytes(fd: int, offset: int, nbyte: int = RAW_SECTOR_SIZE,
         (nbyte & 0x00FF)              # 11. nbyte LSB
     ])
 
-    return cextension.command_device(fd, cmd, nbyte, timeout, verbose)
+def set_cd_speed_command(read_speed: int, write_speed: int = MAX_SPEED):
+    """ Build the command bytes to set the drive speed.
+
+    Args:
+        read_speed (int): read speed in kB/s, MAX_SPEED for the fastest
+        write_speed (int, optional): write speed in kB/s (default: MAX_SPEED)
+
+    Returns:
+        (bytes): 12 command bytes
+    """
+    if not 0 < read_speed <= MAX_SPEED or not 0 < write_speed <= MAX_SPEED:
+        raise ValueError("invalid speed (valid: 1 - 65535 kB/s)")
+
+    return bytes([
+        MMC_SET_CD_SPEED,            #  0. set cd speed command
+        0,                           #  1. rotational control (CLV)
+        (read_speed & 0xFF00) >> 8,  #  2. read speed MSB
+        (read_speed & 0x00FF),       #  3. read speed LSB
+        (write_speed & 0xFF00) >> 8, #  4. write speed MSB
+        (write_speed & 0x00FF),      #  5. write speed LSB
+        0,                           #  6. empty
+        0,                           #  7. empty
+        0,                           #  8. empty
+        0,                           #  9. empty
+        0,                           # 10. empty
+        0                            # 11. empty
+    ])
+
+def set_streaming_command(nbyte: int = STREAMING_DESCRIPTOR_SIZE):
+    """ Build the command bytes to send a performance descriptor
+    (see streaming_descriptor) to the drive.
+
+    Args:
+        nbyte (int, optional): parameter list length (default: 28)
+
+    Returns:
+        (bytes): 12 command bytes
+    """
+    return bytes([
+        MMC_SET_STREAMING,     #  0. set streaming command
+        0,                     #  1. empty
+        0,                     #  2. empty
+        0,                     #  3. empty
+        0,                     #  4. empty
+        0,                     #  5. empty
+        0,                     #  6. empty
+        0,                     #  7. empty
+        0,                     #  8. type (performance descriptor)
+        (nbyte & 0xFF00) >> 8, #  9. parameter list length MSB
+        (nbyte & 0x00FF),      # 10. parameter list length LSB
+        0                      # 11. empty
+    ])
+
+def streaming_descriptor(read_speed: int, start: int = 0, end: int = 0xFFFFFFFF,
+                         exact: bool = False, restore: bool = False):
+    """ Build the performance descriptor sent by set_streaming_command().
+
+    Args:
+        read_speed (int): read speed in kB/s for sectors [start, end]
+        start (int, optional): first sector (default: 0)
+        end (int, optional): last sector (default: end of the disc)
+        exact (bool, optional): fail instead of picking the nearest speed (default: False)
+        restore (bool, optional): restore the drive's default speeds (default: False)
+
+    Returns:
+        (bytearray): 28 descriptor bytes
+    """
+    descriptor = bytearray(STREAMING_DESCRIPTOR_SIZE)
+    descriptor[0] = (0x04 if restore else 0) | (0x02 if exact else 0)
+    descriptor[4:8] = start.to_bytes(4, 'big')
+    descriptor[8:12] = end.to_bytes(4, 'big')
+    descriptor[12:16] = read_speed.to_bytes(4, 'big')  # kB read ...
+    descriptor[16:20] = (1000).to_bytes(4, 'big')      # ... per 1000 ms
+    descriptor[20:24] = read_speed.to_bytes(4, 'big')  # same for writing
+    descriptor[24:28] = (1000).to_bytes(4, 'big')
+    return descriptor
+
+def drive_info(fd: int, timeout: int = 1, verbose: bool = False):
+    """ Retrieve drive model info
+
+    Args:
+        fd (int): file descriptor
+        timeout (int): command timeout in seconds
+        verbose (bool): set to True to print more info
+
+    Returns:
+        (str): model string
+    """
+    cmd = inquiry_command()
+
+    status, buffer = _execute(fd, cmd, cmd[4], timeout, verbose)
+
+    return parse_inquiry(buffer)
+
+def drive_spin(fd: int, state: bool, timeout: int = 1, verbose: bool = False):
+    """ Set the drive spin state. A spin state of True indicates the
+    disc is spinning whereas False means the disc is stopped.
+
+    Args:
+        fd (int): file descriptor
+        state (bool): spin state
+        timeout (int): command timeout in seconds
+        verbose (bool): set to True to print more info
+
+    Returns:
+        (int): command status (-1 means fail)
+    """
+    cmd = start_stop_command(state)
+
+    status, buffer = _execute(fd, cmd, 8, timeout, verbose)
+
+    return status
+
+def drive_speed(fd: int, read_speed: int, timeout: int = 1, verbose: bool = False):
+    """ Set the drive read speed with SET CD SPEED.
+
+    Args:
+        fd (int): file descriptor
+        read_speed (int): read speed in kB/s (1x DVD = 1385), MAX_SPEED for the fastest
+        timeout (int): command timeout in seconds
+        verbose (bool): set to True to print more info
+
+    Returns:
+        (int): command status (-1 means fail)
+    """
+    cmd = set_cd_speed_command(read_speed)
+
+    status, buffer = _execute(fd, cmd, 0, timeout, verbose)
+
+    return status
+
+def read_sectors(fd: int, sector: int, sectors: int = SECTORS_PER_BLOCK,
+                 streaming: bool = False, timeout: int = 1, verbose: bool = False,
+                 buffer=None):
+    """ Read 2048 byte user data sectors from the drive. These do not
+    include the first 12 bytes (ID, IED, CPR_MAI) or last 4 bytes (EDC)
+    found in raw sectors.
+
+    Args:
+        fd (int): file descriptor
+        sector (int): starting sector
+        sectors (int, optional): number of sectors to read (default: 16)
+        streaming (int, optional): use streaming mode when True (default: False)
+        timeout (int, optional): command timeout in seconds (default: 1)
+        verbose (bool, optional): set to True to print more info (default: False)
+        buffer (writable bytes-like, optional): filled in place instead of
+            returning new bytes, the GIL is released while waiting (default: None)
+
+    Returns:
+        (int, bytearray): tuple with (command status, buffer)
+    """
+    cmd = read_12_command(sector, sectors, streaming)
+
+    return _execute(fd, cmd, sectors * SECTOR_SIZE, timeout, verbose, buffer)
+
+def read_raw_bytes(fd: int, offset: int, nbyte: int = RAW_SECTOR_SIZE,
+                   timeout: int = 1, verbose: bool = False, buffer=None):
+    """ Reads raw bytes from the drive cache. This cache consists of
+    2064 byte raw sectors with ID, IED, CPR_MAI, USER DATA, and EDC fields.
+
+    Note you must do the following before using this command:
+      1. Execute a read_sectors() command with streaming = True to fill the cache.
+      2. Ensure you're running the command with root privileges.
+         The command will not work with regular user privileges.
+
+    Args:
+        fd (int): file descriptor
+        offset (int): starting memory offset within cache
+        nbyte (int, optional): number of memory bytes to read starting from offset (default: 2064)
+        timeout (int, optional): command timeout in seconds (default: 1)
+        verbose (bool, optional): set to True to print more info (default: False)
+        buffer (writable bytes-like, optional): filled in place instead of
+            returning new bytes, the GIL is released while waiting (default: None)
+
+    Returns:
+        (int, bytearray): tuple with (command status, buffer)
+    """
+    cmd = read_memory_command(offset, nbyte)
+
+    return _execute(fd, cmd, nbyte, timeout, verbose, buffer)
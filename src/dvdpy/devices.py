@@ -18,30 +18,238 @@
 # along with this program; if not, write to the Free Software
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
 from . import commands
-from . import cextension
+from . import governor
+from . import reader
+from . import scheduler
+from . import telemetry
+from . import transports
+from . import dump as _dump
 
-__all__ = ['dvd']
+__all__ = ['dvd', 'async_dvd']
 
 class dvd:
     """ A class for the DVD drive interface
 
+    Every command sent through this class is recorded in the
+    telemetry attribute (counters, per opcode latency and errors)
+    and passed to the speed governor when one is set (see govern()).
+
     Parameters:
-        address (str): path to drive
+        address (str): path to drive (ignored when a transport is given)
         timeout (int): command timeout in seconds
+        transport (optional): object carrying the commands to the drive,
+            defaults to transports.linux_transport(address), pass
+            transports.open_transport(address) to use the queued sg transport
     """
-    def __init__(self, address, timeout=1):
-        self.fd = cextension.open_device(address)
+    def __init__(self, address=None, timeout=1, transport=None):
+        if transport is None:
+            transport = transports.linux_transport(address)
+        self.transport = transport
+        self.fd = getattr(transport, "fd", -1)
         self.timeout = timeout
+        self.telemetry = telemetry.telemetry()
+        self.governor = None
 
     def __del__(self):
-        cextension.close_device(self.fd)
+        transport = getattr(self, "transport", None)
+        if transport is not None:
+            transport.close()
+
+    def execute(self, cmd: bytes, buffer, verbose: bool = False):
+        """ Send a 12 byte command, filling buffer in place
+
+        Returns:
+            (CommandResult): status, sense key, asc, ascq and latency
+        """
+        result = self.transport.execute(cmd, buffer, self.timeout, verbose)
+        self._record(cmd[0], len(buffer), result)
+        return result
+
+    def submit(self, cmd: bytes, buffer):
+        """ Start a 12 byte command without waiting for it (when the
+        transport supports it), returning a ticket for wait()
+        """
+        return (cmd[0], len(buffer), self.transport.submit(cmd, buffer, self.timeout))
+
+    def wait(self, ticket):
+        """ Wait for a command started with submit()
+
+        Returns:
+            (CommandResult): status, sense key, asc, ascq and latency
+        """
+        opcode, nbyte, transport_ticket = ticket
+        result = self.transport.wait(transport_ticket)
+        self._record(opcode, nbyte, result)
+        return result
+
+    def _record(self, opcode: int, nbyte: int, result):
+        self.telemetry.record(opcode, nbyte, result)
+        if self.governor is not None:
+            self.governor.command(opcode, nbyte, result)
+
+    def _transfer(self, cmd: bytes, buflen: int, buffer, verbose: bool):
+        if buffer is None:
+            buffer = bytearray(buflen)
+
+        view = memoryview(buffer).cast('B')
+        if len(view) < buflen:
+            raise ValueError(f"buffer too small (need {buflen} bytes)")
+
+        result = self.execute(cmd, view[:buflen], verbose)
+
+        return result.status, buffer
 
     def model_info(self, verbose: bool = False):
-        return commands.drive_info(self.fd, self.timeout, verbose) 
+        status, buffer = self._transfer(commands.inquiry_command(), 36, None, verbose)
+        return commands.parse_inquiry(buffer)
 
     def start(self, verbose: bool = False):
-        return commands.drive_spin(self.fd, True, self.timeout, verbose)
+        return self._transfer(commands.start_stop_command(True), 8, None, verbose)[0]
 
     def stop(self, verbose: bool = False):
-        return commands.drive_spin(self.fd, False, self.timeout, verbose)
+        return self._transfer(commands.start_stop_command(False), 8, None, verbose)[0]
+
+    def set_speed(self, read_speed: int, streaming: bool = False, verbose: bool = False):
+        """ Set the read speed in kB/s (1x DVD = 1385, commands.MAX_SPEED
+        for the fastest) with SET CD SPEED, or SET STREAMING when streaming
+
+        Returns:
+            (int): command status (-1 means fail)
+        """
+        if streaming:
+            descriptor = commands.streaming_descriptor(read_speed)
+            return self._transfer(commands.set_streaming_command(len(descriptor)),
+                                  len(descriptor), descriptor, verbose)[0]
+        return self._transfer(commands.set_cd_speed_command(read_speed), 0, None, verbose)[0]
+
+    def govern(self, speeds=governor.DEFAULT_SPEEDS, **options):
+        """ Adapt the speed to the disc while reading, see governor.speed_governor.
+        Pass speeds=None to stop governing and restore the fastest speed.
+
+        Returns:
+            (governor.speed_governor or None)
+        """
+        if speeds is None:
+            self.governor = None
+            self.set_speed(commands.MAX_SPEED)
+            return None
+
+        self.governor = governor.speed_governor(self, speeds, **options)
+        self.governor.apply()
+        return self.governor
+
+    def read_sectors(self, sector: int, sectors: int = commands.SECTORS_PER_BLOCK,
+                     streaming: bool = False, verbose: bool = False, buffer=None):
+        """ See commands.read_sectors() """
+        cmd = commands.read_12_command(sector, sectors, streaming)
+        return self._transfer(cmd, sectors * commands.SECTOR_SIZE, buffer, verbose)
+
+    def read_raw_bytes(self, offset: int, nbyte: int = commands.RAW_SECTOR_SIZE,
+                       verbose: bool = False, buffer=None):
+        """ See commands.read_raw_bytes() """
+        cmd = commands.read_memory_command(offset, nbyte)
+        return self._transfer(cmd, nbyte, buffer, verbose)
+
+    def open(self, sectors: int = None, cache_size: int = 8 << 20, read_ahead: int = 8):
+        """ Open the disc as a random access file-like object with an
+        LRU block cache and read-ahead. See reader.disc_reader
+
+        Returns:
+            (reader.disc_reader)
+        """
+        return reader.disc_reader(self, sectors, cache_size, read_ahead)
+
+    def dump(self, path: str, start: int, end: int, depth: int = 4, progress=None,
+             executor=None, resume: bool = True, retries: int = 4,
+             hashes=("md5", "sha1")):
+        """ Dump user data sectors [start, end) to an image file,
+        overlapping drive reads with descrambling, EDC verification
+        and writing. See dump.dump()
+
+        Returns:
+            (dump.dump_stats): totals, bad sectors and throughput
+        """
+        return _dump.dump(self, path, start, end, depth, progress, executor, resume, retries, hashes)
+
+class async_dvd:
+    """ asyncio interface for the DVD drive
+
+    Each drive gets a single worker thread so its commands stay in order
+    while the event loop keeps running. The commands release the GIL while
+    waiting on the drive, so one loop can drive several drives at once.
+
+    Parameters:
+        address (str): path to drive (ignored when a transport is given)
+        timeout (int): command timeout in seconds
+        transport (optional): see dvd
+    """
+    def __init__(self, address=None, timeout=1, transport=None):
+        self.drive = dvd(address, timeout, transport)
+        self.executor = ThreadPoolExecutor(max_workers=1)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+
+    @property
+    def telemetry(self):
+        return self.drive.telemetry
+
+    async def _run(self, function, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, function, *args)
+
+    async def model_info(self, verbose: bool = False):
+        return await self._run(self.drive.model_info, verbose)
+
+    async def start(self, verbose: bool = False):
+        return await self._run(self.drive.start, verbose)
+
+    async def stop(self, verbose: bool = False):
+        return await self._run(self.drive.stop, verbose)
+
+    async def read_sectors(self, sector: int, sectors: int = commands.SECTORS_PER_BLOCK,
+                           streaming: bool = False, verbose: bool = False, buffer=None):
+        """ See commands.read_sectors() """
+        return await self._run(self.drive.read_sectors, sector, sectors, streaming, verbose, buffer)
+
+    async def read_raw_bytes(self, offset: int, nbyte: int = commands.RAW_SECTOR_SIZE,
+                             verbose: bool = False, buffer=None):
+        """ See commands.read_raw_bytes() """
+        return await self._run(self.drive.read_raw_bytes, offset, nbyte, verbose, buffer)
+
+    async def blocks(self, start: int, end: int, decode_executor=None):
+        """ Yield the verified, descrambled ECC blocks of sectors [start, end).
+        The next block is read from the drive while the current one is
+        decoded (in decode_executor, default: the loop's executor).
+
+        Yields:
+            (int, bytes, list of int, int or None): first sector, user data,
+                bad sectors and seed (see dump.decode_block)
+        """
+        loop = asyncio.get_running_loop()
+        cache = scheduler.cache_scheduler(self.drive)
+
+        def read(sector):
+            # one ECC block at a time so every block has a single seed
+            count = min(commands.SECTORS_PER_BLOCK - sector % commands.SECTORS_PER_BLOCK, end - sector)
+            buffer = bytearray(count * commands.RAW_SECTOR_SIZE)
+            return sector, count, buffer, cache.read(sector, count, buffer)
+
+        aligned = range((start // commands.SECTORS_PER_BLOCK + 1) * commands.SECTORS_PER_BLOCK,
+                        end, commands.SECTORS_PER_BLOCK)
+        sectors = [start] + list(aligned) if start < end else []
+        pending = loop.run_in_executor(self.executor, read, sectors[0]) if sectors else None
+        for i in range(len(sectors)):
+            sector, count, buffer, missing = await pending
+            if i + 1 < len(sectors):
+                pending = loop.run_in_executor(self.executor, read, sectors[i + 1])
+            yield await loop.run_in_executor(decode_executor, _dump.decode_block, sector, count, buffer, missing)
@@ -0,0 +1,337 @@
+# Copyright (C) 2025     Josh Wood
+# 
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+import mmap
+import os
+import queue
+import threading
+import time
+import zlib
+
+from . import commands
+from . import hashing
+from . import index
+from . import raw
+from . import retry
+from . import scheduler
+
+RAW = commands.RAW_SECTOR_SIZE
+USER = commands.SECTOR_SIZE
+BLOCK = commands.SECTORS_PER_BLOCK
+
+class dump_stats:
+    """ Progress of a dump, updated as blocks are written """
+    __slots__ = ("sectors", "skipped", "bad_sectors", "damage", "digests", "bytes", "started", "elapsed")
+
+    def __init__(self):
+        self.sectors = 0
+        self.skipped = 0
+        self.bad_sectors = []
+        self.damage = {}
+        self.digests = {}
+        self.bytes = 0
+        self.started = time.monotonic()
+        self.elapsed = 0.0
+
+    def mb_per_s(self):
+        return self.bytes / self.elapsed / 1e6 if self.elapsed > 0 else 0.0
+
+def decode_block(sector: int, count: int, buffer, missing=()):
+    """ Recover the seed, descramble and verify a block of raw sectors.
+
+    Note:
+        The seed changes every 16 physical sectors, so the sectors must
+        not span two ECC blocks.
+
+    Args:
+        sector (int): user sector of the first raw sector
+        count (int): number of raw sectors in buffer
+        buffer (bytes-like): raw sectors, descrambled in place when writable
+        missing (list of int, optional): indices of sectors known to be bad (default: none)
+
+    Returns:
+        (int, bytes, list of int, int or None): first sector, user data,
+            bad sectors and seed
+    """
+    if sector // BLOCK != (sector + count - 1) // BLOCK:
+        raise ValueError("sectors span two ECC blocks")
+    if memoryview(buffer).readonly:
+        buffer = bytearray(buffer)
+
+    block = raw.raw_block(buffer, count)
+    # slots known to be bad could hold anything, even a different sector
+    seed = block.recover_seed(missing)
+    if seed is not None:
+        block.descramble(seed)
+        valid = block.valid()
+    else:
+        valid = [False] * count
+    for i in missing:
+        valid[i] = False
+
+    return sector, block.user_data(), [sector + i for i in range(count) if not valid[i]], seed
+
+def dump(drive, path: str, start: int, end: int, depth: int = 4, progress=None,
+         executor=None, resume: bool = True, retries: int = 4,
+         hashes=("md5", "sha1")):
+    """ Dump user data sectors [start, end) to an image file.
+
+    The work is split into three threads connected by bounded queues
+    so that the drive keeps reading while earlier blocks are being
+    descrambled, verified and written:
+
+      1. read: pull the raw sectors from drive memory into a free
+         buffer, filling the cache only when needed (see scheduler)
+      2. decode: recover the seed, descramble and verify the EDC,
+         handing the work to executor when one is given
+      3. write: write the user data to the memory mapped image and
+         record the block in the index (see index.block_index)
+
+    Blocks with failing sectors are sent back to the read thread, which
+    rereads them (see retry) before its next read, and their rereads are
+    reported in dump_stats.damage. When the drive has a speed governor
+    (see devices.dvd.govern) it is told about every failing sector and
+    slows the drive down for the rereads.
+
+    Every block is also hashed on the fly once it is final, i.e. after
+    its rereads (see hashing), and the digests are written with the per
+    block CRCs to path + ".hashes".
+
+    The index stored next to the image (path + ".idx") records which
+    blocks were verified, so a resumed or repeated dump only rereads
+    blocks that are missing or failed their EDC check.
+
+    Args:
+        drive (devices.dvd): the drive to read from
+        path (str): path of the output image
+        start (int): first sector
+        end (int): sector after the last sector
+        depth (int, optional): number of blocks buffered between stages (default: 4)
+        progress (callable, optional): called with the dump_stats after each block (default: None)
+        executor (concurrent.futures.Executor, optional): runs decode_block() so that
+            several blocks are decoded in parallel, e.g. a ProcessPoolExecutor (default: None)
+        resume (bool, optional): keep the verified blocks of an earlier dump
+            to the same image and sector range (default: True)
+        retries (int, optional): reread attempts for failing sectors, 0 to
+            skip rereading (default: 4)
+        hashes (tuple of str, optional): hashlib algorithms computed besides
+            crc32, None to skip hashing (default: ("md5", "sha1"))
+
+    Returns:
+        (dump_stats): totals, bad sectors and throughput
+    """
+    if end <= start:
+        raise ValueError("end must be greater than start")
+
+    size = (end - start) * USER
+    index_path = path + ".idx"
+    if not resume or not os.path.exists(path) or os.path.getsize(path) != size:
+        if os.path.exists(index_path):
+            os.remove(index_path)
+    blocks = index.block_index(index_path, start, end)
+    pending = blocks.pending()
+
+    # the hashes of an earlier dump no longer describe the image
+    hashes_path = path + ".hashes"
+    if os.path.exists(hashes_path):
+        os.remove(hashes_path)
+
+    stats = dump_stats()
+    stats.skipped = blocks.blocks - len(pending)
+    # blocks read while a bad block is reread wait in the hasher
+    hasher = hashing.image_hasher(hashes, max(64, 4 * depth)) if hashes is not None else None
+    if hasher is not None and stats.skipped:
+        # blocks kept from an earlier dump are hashed from the image at the end
+        hasher.streaming = False
+    free = queue.Queue()
+    for _ in range(depth + 2):
+        free.put(bytearray(BLOCK * RAW))
+    raw_blocks = queue.Queue(maxsize=depth)
+    user_blocks = queue.Queue(maxsize=depth)
+    cache = scheduler.cache_scheduler(drive)
+    engine = None
+    if retries > 0:
+        slow_down = drive.governor.slow_down if drive.governor is not None else None
+        engine = retry.retry_engine(drive, retries, slow_down=slow_down, cache=cache)
+    rereads = queue.Queue()   # (block, bad sectors) from the writer
+    patches = queue.Queue()   # (block, recovered sectors) from the reader
+    waiting = {}              # block -> bad sectors, until its patch is applied
+    errors = []
+    stop = threading.Event()
+
+    def put(q, item):
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def get(q):
+        while True:
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                if stop.is_set():
+                    return None
+
+    def reread(bad):
+        engine.record(bad)
+        return engine.run()
+
+    def serve():
+        # reread the bad blocks found so far before reading on
+        while True:
+            try:
+                block, bad = rereads.get_nowait()
+            except queue.Empty:
+                return
+            patches.put((block, reread(bad)))
+
+    def read():
+        try:
+            for i, sector in enumerate(pending):
+                serve()
+                # windows are the ECC blocks of the index, clipped to [start, end)
+                count = blocks.sectors(blocks.block(sector))[1] - sector
+                buffer = get(free)
+                if buffer is None:
+                    return
+                # the fill of the next block is queued behind this block's memory read
+                ahead = None
+                if i + 1 < len(pending):
+                    ahead = (pending[i + 1], blocks.sectors(blocks.block(pending[i + 1]))[1] - pending[i + 1])
+                missing = cache.read(sector, count, buffer, prefetch=ahead)
+                put(raw_blocks, (sector, count, buffer, missing))
+        except BaseException as e:
+            errors.append(e)
+            stop.set()
+        finally:
+            try:
+                cache.drain()
+            except BaseException as e:
+                errors.append(e)
+            put(raw_blocks, None)
+
+    def decode():
+        try:
+            while (item := get(raw_blocks)) is not None:
+                sector, count, buffer, missing = item
+                if executor is None:
+                    decoded = decode_block(sector, count, buffer, missing)
+                else:
+                    decoded = executor.submit(decode_block, sector, count, bytes(buffer[:count * RAW]), missing)
+                free.put(buffer)
+                put(user_blocks, decoded)
+        except BaseException as e:
+            errors.append(e)
+            stop.set()
+        finally:
+            put(user_blocks, None)
+
+    def patch(block, recovered):
+        # write the reread sectors of a block, which is then final
+        first, last = blocks.sectors(block)
+        for sector, (user, seed) in recovered.items():
+            offset = (sector - start) * USER
+            image[offset:offset + USER] = user
+        data = image[(first - start) * USER:(last - start) * USER]
+
+        bad = [sector for sector in waiting.pop(block) if sector not in recovered]
+        if recovered:
+            status, seed, crc = blocks.entry(block)
+            if seed is None:
+                seed = next(iter(recovered.values()))[1]
+            blocks.record(block, index.FAILED if bad else index.VERIFIED, seed, zlib.crc32(data))
+            stats.bad_sectors = [sector for sector in stats.bad_sectors if sector not in recovered]
+        if hasher is not None:
+            hasher.update((first - start) * USER, data)
+
+    def collect():
+        while not patches.empty():
+            patch(*patches.get())
+
+    threads = [threading.Thread(target=read, daemon=True),
+               threading.Thread(target=decode, daemon=True)]
+
+    # the image is a sparse file of the final size written through a memory map
+    with open(path, "r+b" if os.path.exists(path) else "w+b") as f:
+        f.truncate(size)
+        image = mmap.mmap(f.fileno(), size)
+        for thread in threads:
+            thread.start()
+
+        completed = False
+        try:
+            while (item := get(user_blocks)) is not None:
+                # blocks may finish out of order when decoded by an executor
+                sector, user, bad, seed = item.result() if executor is not None else item
+                offset = (sector - start) * USER
+                image[offset:offset + len(user)] = user
+                blocks.record(blocks.block(sector), index.FAILED if bad else index.VERIFIED,
+                              seed, zlib.crc32(user))
+                if bad and engine is not None:
+                    # hashed once the read thread has reread it
+                    waiting[blocks.block(sector)] = bad
+                    rereads.put((blocks.block(sector), bad))
+                elif hasher is not None:
+                    hasher.update(offset, user)
+                if drive.governor is not None:
+                    drive.governor.sectors(len(user) // USER, len(bad))
+
+                stats.sectors += len(user) // USER
+                stats.bad_sectors.extend(bad)
+                stats.bytes += len(user)
+                stats.elapsed = time.monotonic() - stats.started
+                collect()
+                if progress is not None:
+                    progress(stats)
+            completed = not errors
+        finally:
+            stop.set()
+            for thread in threads:
+                thread.join()
+            if not completed:
+                if hasher is not None:
+                    hasher.finish()
+                image.flush()
+                image.close()
+                blocks.close()
+
+        if errors:
+            raise errors[0]
+
+        # the read thread has stopped, so the drive is free for the rereads
+        # of the last blocks, and hashes only follow a dump that ran to the end
+        try:
+            collect()
+            for block in sorted(waiting):
+                patch(block, reread(waiting[block]))
+            stats.bad_sectors.sort()
+            if engine is not None:
+                stats.damage = engine.damage_map()
+            if hasher is not None:
+                stats.digests = hasher.finish(image, size)
+                hashing.write_sidecar(hashes_path, size, stats.digests,
+                                      [blocks.entry(block)[2] for block in range(blocks.blocks)])
+        finally:
+            if hasher is not None:
+                hasher.finish()
+            image.flush()
+            image.close()
+            blocks.close()
+
+    return stats
@@ -73,3 +73,200 @@ def calc_edc(data: bytes):
         crc = (crc << 8) ^ (table[((crc >> 24)  ^ by) & 0xFF])
         crc &= 0xFFFFFFFF
     return crc
+
+# Faster EDC calculation. calc_edc() above handles one byte per loop which
+# is easy to follow but slow. The same table can be extended so that each
+# loop handles 8 bytes ("slicing-by-8"): table_n[i] is the CRC of byte i
+# followed by n zero bytes, so the contributions of 8 bytes can be looked
+# up independently and combined with xor.
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from functools import lru_cache
+import struct
+
+POLYNOMIAL = 0x180000011
+RAW_SECTOR_SIZE = 2064
+
+def _shift_byte(crc: int):
+    return ((crc << 8) & 0xFFFFFFFF) ^ table[crc >> 24]
+
+slice_tables = [table]
+for n in range(7):
+    slice_tables.append([_shift_byte(crc) for crc in slice_tables[-1]])
+
+def calc_edc_fast(data: bytes, edc: int = 0):
+    """Calculate the EDC value for data bytes using slicing-by-8.
+
+    Note:
+        Passing the EDC of previous data continues the calculation,
+        i.e. calc_edc_fast(b, calc_edc_fast(a)) == calc_edc(a + b).
+
+    Args:
+        data (bytes): data bytes to compute EDC over
+        edc (int, optional): EDC of the preceding data (default: 0)
+
+    Returns:
+        (int)
+    """
+    t0, t1, t2, t3, t4, t5, t6, t7 = slice_tables
+
+    crc = edc
+    n8 = len(data) & ~7
+    for hi, lo in struct.iter_unpack('>II', memoryview(data)[:n8]):
+        hi ^= crc
+        crc = (t7[hi >> 24] ^ t6[(hi >> 16) & 0xFF] ^ t5[(hi >> 8) & 0xFF] ^ t4[hi & 0xFF] ^
+               t3[lo >> 24] ^ t2[(lo >> 16) & 0xFF] ^ t1[(lo >> 8) & 0xFF] ^ t0[lo & 0xFF])
+
+    for by in data[n8:]:
+        crc = ((crc << 8) & 0xFFFFFFFF) ^ table[(crc >> 24) ^ by]
+
+    return crc
+
+def _multiply(a: int, b: int):
+    # product of two polynomials over GF(2) modulo the EDC polynomial
+    product = 0
+    while b:
+        if b & 1:
+            product ^= a
+        b >>= 1
+        a <<= 1
+        if a & 0x100000000:
+            a ^= POLYNOMIAL
+    return product
+
+@lru_cache(maxsize=32)
+def _shift_factor(length: int):
+    # x^(8 * length) modulo the EDC polynomial
+    factor, power, n = 1, 2, 8 * length
+    while n:
+        if n & 1:
+            factor = _multiply(factor, power)
+        power = _multiply(power, power)
+        n >>= 1
+    return factor
+
+def combine_edc(edc1: int, edc2: int, length2: int):
+    """Combine the EDC values of two pieces of data into the EDC of
+    the pieces joined together, without revisiting the data.
+
+    Args:
+        edc1 (int): EDC of the first piece
+        edc2 (int): EDC of the second piece
+        length2 (int): length of the second piece in bytes
+
+    Returns:
+        (int): EDC of the first piece followed by the second piece
+    """
+    return _multiply(edc1, _shift_factor(length2)) ^ edc2
+
+@lru_cache(maxsize=1)
+def position_table():
+    """Builds the table of each byte's contribution to the EDC of a
+    raw sector. Row i holds the EDC of byte values 0-255 at offset i
+    followed by zeros up to the end of the 2060 protected bytes, so
+    the EDC of a sector is the xor of one entry from every row.
+
+    Returns:
+        (numpy.ndarray): uint32 array with shape (2060, 256)
+    """
+    t0 = numpy.array(table, dtype=numpy.uint32)
+
+    rows = numpy.empty((RAW_SECTOR_SIZE - 4, 256), dtype=numpy.uint32)
+    rows[-1] = t0
+    for i in range(len(rows) - 2, -1, -1):
+        rows[i] = (rows[i + 1] << 8) ^ t0[rows[i + 1] >> 24]
+
+    return rows
+
+def calc_edc_many(buffer, count: int, stride: int = RAW_SECTOR_SIZE):
+    """Verify the EDC of many raw 2064 byte sectors in one call.
+
+    Args:
+        buffer (bytes-like): buffer holding the raw sectors
+        count (int): number of sectors to verify
+        stride (int, optional): bytes from the start of one sector to the next (default: 2064)
+
+    Returns:
+        (list of bool): True for each sector whose EDC is valid
+    """
+    if stride < RAW_SECTOR_SIZE:
+        raise ValueError("stride must be at least %d bytes" % RAW_SECTOR_SIZE)
+    if count > 0 and len(memoryview(buffer).cast('B')) < (count - 1) * stride + RAW_SECTOR_SIZE:
+        raise ValueError("buffer too small for %d sectors" % count)
+
+    if numpy is None:
+        view = memoryview(buffer).cast('B')
+        results = []
+        for i in range(count):
+            sector = view[i * stride:i * stride + RAW_SECTOR_SIZE]
+            results.append(calc_edc_fast(sector[:-4]) == int.from_bytes(sector[-4:], 'big'))
+        return results
+
+    sectors = numpy.ndarray((count, RAW_SECTOR_SIZE), dtype=numpy.uint8,
+                            buffer=buffer, strides=(stride, 1))
+
+    rows = position_table()
+    contributions = rows[numpy.arange(RAW_SECTOR_SIZE - 4), sectors[:, :-4]]
+    data_edc = numpy.bitwise_xor.reduce(contributions, axis=1)
+    disc_edc = sectors[:, -4:].astype(numpy.uint32) << numpy.array([24, 16, 8, 0], dtype=numpy.uint32)
+    disc_edc = numpy.bitwise_or.reduce(disc_edc, axis=1)
+
+    return (data_edc == disc_edc).tolist()
+
+# ID Error Detection (IED) code. The 4 ID bytes c0-c3 are protected by a
+# Reed-Solomon code over GF(2^8) with primitive polynomial
+# x^8 + x^4 + x^3 + x^2 + 1 and generator G(x) = (x + 1)(x + a) where a = 2:
+#
+#     IED(x) = c4 x + c5 = (c0 x^3 + c1 x^2 + c2 x + c3) x^2 mod G(x)
+#
+# The remainder is linear in the ID bytes, so the IED is the xor of one
+# precomputed 16 bit entry per ID byte.
+
+GF_POLYNOMIAL = 0x11D
+
+gf_exp = [0] * 512
+gf_log = [0] * 256
+value = 1
+for power in range(255):
+    gf_exp[power] = value
+    gf_log[value] = power
+    value <<= 1
+    if value & 0x100:
+        value ^= GF_POLYNOMIAL
+for power in range(255, 512):
+    gf_exp[power] = gf_exp[power - 255]
+
+def gf_multiply(a: int, b: int):
+    """ Multiply two elements of GF(2^8) """
+    if a == 0 or b == 0:
+        return 0
+    return gf_exp[gf_log[a] + gf_log[b]]
+
+def _ied_remainder(id_bytes):
+    # G(x) = x^2 + 3x + 2 so shift each byte through a 2 byte register
+    r1, r0 = 0, 0
+    for c in id_bytes:
+        feedback = c ^ r1
+        r1 = r0 ^ gf_multiply(feedback, 3)
+        r0 = gf_multiply(feedback, 2)
+    return (r1 << 8) | r0
+
+# ied_tables[j][c] is the IED of an ID holding c at byte j and zeros elsewhere
+ied_tables = [[_ied_remainder([c if i == j else 0 for i in range(4)]) for c in range(256)]
+              for j in range(4)]
+
+def calc_ied(id_bytes):
+    """Calculate the ID Error Detection (IED) code of a sector ID.
+
+    Args:
+        id_bytes (bytes): the 4 ID bytes
+
+    Returns:
+        (int): 16 bit IED (first IED byte in the high bits)
+    """
+    t0, t1, t2, t3 = ied_tables
+    return t0[id_bytes[0]] ^ t1[id_bytes[1]] ^ t2[id_bytes[2]] ^ t3[id_bytes[3]]
@@ -0,0 +1,179 @@
+# Copyright (C) 2025     Josh Wood
+# 
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+# Several drives on one host. Each drive runs its command loop in its own
+# worker (a process by default, or a thread since the drive commands
+# release the GIL) and decoding is spread over the remaining cores with a
+# pool of decode processes per drive. Workers report progress over a
+# queue so that per drive and aggregate throughput can be followed.
+
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from . import devices
+
+# seconds between checks that the workers are still alive
+POLL_INTERVAL = 0.5
+
+class dump_job:
+    """ One dump of sectors [start, end) from a drive to an image
+
+    Parameters:
+        drive (str or callable): path to the drive, or a picklable callable
+            returning a transport (e.g. functools.partial(transports.simulated_transport, path))
+        path (str): path of the output image
+        start (int): first sector
+        end (int): sector after the last sector
+    """
+    __slots__ = ("drive", "path", "start", "end")
+
+    def __init__(self, drive, path: str, start: int, end: int):
+        self.drive = drive
+        self.path = path
+        self.start = start
+        self.end = end
+
+def _worker(index: int, job: dump_job, timeout: int, depth: int, decoders: int, updates):
+    """ Dump one job, sending (index, kind, value) updates """
+    try:
+        if callable(job.drive):
+            drive = devices.dvd(timeout=timeout, transport=job.drive())
+        else:
+            drive = devices.dvd(job.drive, timeout)
+
+        def progress(stats):
+            updates.put((index, "progress", (stats.sectors, stats.bytes, stats.elapsed, len(stats.bad_sectors))))
+
+        if decoders > 0:
+            with ProcessPoolExecutor(decoders) as executor:
+                stats = drive.dump(job.path, job.start, job.end, depth, progress, executor)
+        else:
+            stats = drive.dump(job.path, job.start, job.end, depth, progress)
+
+        updates.put((index, "done", stats))
+    except BaseException as e:
+        updates.put((index, "error", e))
+
+class farm:
+    """ Runs dumps on several drives at once
+
+    Parameters:
+        jobs (list of dump_job): one job per drive
+        processes (bool): use a worker process per drive when True,
+            otherwise a thread per drive
+        decoders (int): decode processes per drive (default: the cores
+            left over after one per drive, shared evenly)
+        timeout (int): command timeout in seconds
+        depth (int): number of blocks buffered between dump stages
+    """
+    def __init__(self, jobs, processes: bool = True, decoders: int = None,
+                 timeout: int = 1, depth: int = 4):
+        self.jobs = list(jobs)
+        self.processes = processes
+        if decoders is None:
+            decoders = max(0, (os.cpu_count() or 1) - len(self.jobs)) // max(1, len(self.jobs))
+        self.decoders = decoders
+        self.timeout = timeout
+        self.depth = depth
+        self.progress = [(0, 0, 0.0, 0)] * len(self.jobs)
+        self.started = None
+
+    def summary(self):
+        """ Per drive and aggregate progress
+
+        Returns:
+            (dict): sectors, bytes, bad sectors and MB/s per drive and in total
+        """
+        elapsed = time.monotonic() - self.started if self.started is not None else 0.0
+        drives = [{"sectors": sectors, "bytes": nbyte, "bad_sectors": bad,
+                   "mb_per_s": nbyte / seconds / 1e6 if seconds > 0 else 0.0}
+                  for sectors, nbyte, seconds, bad in self.progress]
+        total = sum(drive["bytes"] for drive in drives)
+        return {
+            "drives": drives,
+            "sectors": sum(drive["sectors"] for drive in drives),
+            "bytes": total,
+            "bad_sectors": sum(drive["bad_sectors"] for drive in drives),
+            "elapsed": elapsed,
+            "mb_per_s": total / elapsed / 1e6 if elapsed > 0 else 0.0,
+        }
+
+    def run(self, progress=None):
+        """ Run every job to completion.
+
+        Args:
+            progress (callable, optional): called with summary() after each update (default: None)
+
+        Returns:
+            (list of dump.dump_stats): final statistics of each job
+        """
+        if self.processes:
+            updates = multiprocessing.Queue()
+            workers = [multiprocessing.Process(target=_worker,
+                                               args=(i, job, self.timeout, self.depth, self.decoders, updates))
+                       for i, job in enumerate(self.jobs)]
+        else:
+            updates = queue.Queue()
+            workers = [threading.Thread(target=_worker, daemon=True,
+                                        args=(i, job, self.timeout, self.depth, self.decoders, updates))
+                       for i, job in enumerate(self.jobs)]
+
+        self.started = time.monotonic()
+        for worker in workers:
+            worker.start()
+
+        results = [None] * len(self.jobs)
+        errors = []
+        finished = set()
+        dead = set()
+        while len(finished) < len(self.jobs):
+            try:
+                index, kind, value = updates.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                # a worker that died without reporting (killed, crashed, or
+                # its result could not be pickled) would otherwise hang the
+                # farm. Give its last update one more poll to arrive first.
+                for index in dead - finished:
+                    code = getattr(workers[index], "exitcode", None)
+                    errors.append(RuntimeError(f"dump worker {index} exited (code {code}) without reporting"))
+                    finished.add(index)
+                dead = {index for index, worker in enumerate(workers)
+                        if index not in finished and not worker.is_alive()}
+                continue
+
+            if kind == "progress":
+                self.progress[index] = value
+            elif kind == "done":
+                results[index] = value
+                self.progress[index] = (value.sectors, value.bytes, value.elapsed, len(value.bad_sectors))
+                finished.add(index)
+            else:
+                errors.append(value)
+                finished.add(index)
+            if progress is not None:
+                progress(self.summary())
+
+        for worker in workers:
+            worker.join()
+
+        if errors:
+            raise errors[0]
+
+        return results
@@ -0,0 +1,132 @@
+# Copyright (C) 2025     Josh Wood
+# 
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+# Adaptive spindle speed. Worn or marginal discs read cleanly at low speed
+# but cost time there, clean discs are fastest at full speed. The governor
+# watches every READ_12 (its latency per sector and errors) and the EDC
+# checks reported by the dump, and decides once per window of sectors:
+#
+#   - failing sectors or READ_12 latency far above what this speed
+#     usually takes (the drive retrying internally) drop one speed step
+#   - raise_after clean windows in a row raise one speed step
+#
+# Speed changes are only sent from the thread issuing the reads so they
+# never race the reads themselves.
+
+import threading
+
+from . import commands
+
+DEFAULT_SPEEDS = tuple(n * commands.DVD_1X_SPEED for n in (2, 4, 8, 12, 16))
+
+class speed_governor:
+    """ Raises the drive speed on clean regions and lowers it on marginal ones
+
+    Parameters:
+        drive (devices.dvd): the drive to govern
+        speeds (tuple of int): speed steps in kB/s, slowest first
+        window (int): sectors read between decisions
+        max_failure_rate (float): failing sectors per sector read tolerated in a window
+        latency_factor (float): latency per sector above this multiple of
+            the usual latency at the current speed marks a window marginal
+        raise_after (int): clean windows in a row before speeding up
+        streaming (bool): set speeds with SET STREAMING instead of SET CD SPEED
+    """
+    def __init__(self, drive, speeds=DEFAULT_SPEEDS, window: int = 256,
+                 max_failure_rate: float = 0.0, latency_factor: float = 2.0,
+                 raise_after: int = 4, streaming: bool = False):
+        self.drive = drive
+        self.speeds = tuple(sorted(speeds))
+        self.window = window
+        self.max_failure_rate = max_failure_rate
+        self.latency_factor = latency_factor
+        self.raise_after = raise_after
+        self.streaming = streaming
+        self.lock = threading.RLock()
+        self.level = len(self.speeds) - 1
+        self.baseline = {}   # level -> usual READ_12 latency per sector
+        self.clean = 0
+        self.changes = []    # (sectors read so far, speed) for every change
+        self.total = 0
+        self._reset()
+
+    def _reset(self):
+        self.read = 0
+        self.latency = 0.0
+        self.checked = 0
+        self.failures = 0
+
+    @property
+    def speed(self):
+        return self.speeds[self.level]
+
+    def apply(self, level: int = None):
+        """ Send the speed of level (default: the current one) to the drive """
+        with self.lock:
+            if level is not None:
+                self.level = max(0, min(level, len(self.speeds) - 1))
+            self.changes.append((self.total, self.speed))
+            return self.drive.set_speed(self.speed, self.streaming)
+
+    def slow_down(self):
+        """ Drop to the slowest speed, e.g. as the retry_engine slow_down hook """
+        with self.lock:
+            self.clean = 0
+            if self.level > 0:
+                self.apply(0)
+
+    def sectors(self, count: int, bad: int):
+        """ Record the EDC check of count sectors of which bad failed """
+        with self.lock:
+            self.checked += count
+            self.failures += bad
+
+    def command(self, opcode: int, nbyte: int, result):
+        """ Record a completed command, deciding on the speed once a
+        window of sectors has been read
+        """
+        if opcode != commands.MMC_READ_12:
+            return
+
+        with self.lock:
+            count = max(1, nbyte // commands.SECTOR_SIZE)
+            self.read += count
+            self.total += count
+            self.latency += result.latency
+            if result.status < 0:
+                self.failures += count
+            if self.read >= self.window:
+                self._decide()
+
+    def _decide(self):
+        per_sector = self.latency / self.read
+        failure_rate = self.failures / max(self.read, self.checked)
+        baseline = self.baseline.get(self.level)
+        slow = baseline is not None and per_sector > self.latency_factor * baseline
+        self._reset()
+
+        if failure_rate > self.max_failure_rate or slow:
+            self.clean = 0
+            if self.level > 0:
+                self.apply(self.level - 1)
+            return
+
+        # remember how long clean reads take at this speed
+        self.baseline[self.level] = per_sector if baseline is None else 0.75 * baseline + 0.25 * per_sector
+        self.clean += 1
+        if self.clean >= self.raise_after and self.level < len(self.speeds) - 1:
+            self.clean = 0
+            self.apply(self.level + 1)
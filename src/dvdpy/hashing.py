@@ -0,0 +1,126 @@
+# Copyright (C) 2025     Josh Wood
+# 
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+# Hashes of an image computed while it is being dumped. Each digest runs
+# in its own thread (hashlib and zlib release the GIL on large buffers)
+# and is fed the verified blocks in image order, so cataloguing an image
+# costs no extra pass over the disk. Blocks that arrive out of order, e.g.
+# while an earlier block with bad sectors is being reread, wait in a small
+# reorder buffer. Once the buffer is full, the rest is hashed from the
+# finished image instead.
+
+import hashlib
+import json
+import queue
+import threading
+import zlib
+
+CHUNK_SIZE = 1 << 20
+
+class image_hasher:
+    """ Computes several digests of an image from blocks given by offset
+
+    Parameters:
+        algorithms (tuple of str): hashlib algorithms, crc32 is always included
+        max_pending (int): blocks held waiting for an earlier block
+    """
+    def __init__(self, algorithms=("md5", "sha1"), max_pending: int = 64):
+        self.position = 0
+        self.pending = {}
+        self.max_pending = max_pending
+        self.streaming = True
+        self.results = {}
+        self.workers = []
+
+        for name in algorithms:
+            self._start(name, hashlib.new(name))
+        self._start("crc32", None)
+
+    def _start(self, name: str, digest):
+        blocks = queue.Queue(maxsize=16)
+
+        def work():
+            crc = 0
+            while (data := blocks.get()) is not None:
+                if digest is None:
+                    crc = zlib.crc32(data, crc)
+                else:
+                    digest.update(data)
+            self.results[name] = "%08x" % crc if digest is None else digest.hexdigest()
+
+        thread = threading.Thread(target=work, daemon=True)
+        thread.start()
+        self.workers.append((blocks, thread))
+
+    def _feed(self, data):
+        for blocks, thread in self.workers:
+            blocks.put(data)
+        self.position += len(data)
+
+    def update(self, offset: int, data: bytes):
+        """ Add the data found at offset of the image """
+        if not self.streaming or offset < self.position:
+            return
+
+        self.pending[offset] = data
+        while self.position in self.pending:
+            self._feed(self.pending.pop(self.position))
+
+        if len(self.pending) > self.max_pending:
+            self.streaming = False
+            self.pending.clear()
+
+    def finish(self, image=None, size: int = None):
+        """ Hash whatever was not streamed from the image and return the digests.
+        Calling it without an image just stops the worker threads.
+
+        Args:
+            image (bytes-like, optional): the whole image, e.g. its memory map
+            size (int, optional): image size in bytes (default: len(image))
+
+        Returns:
+            (dict): algorithm -> hex digest
+        """
+        self.pending.clear()
+        if not self.workers:
+            # already finished
+            return dict(self.results)
+        if image is not None:
+            size = len(image) if size is None else size
+            while self.position < size:
+                self._feed(bytes(image[self.position:min(self.position + CHUNK_SIZE, size)]))
+
+        for blocks, thread in self.workers:
+            blocks.put(None)
+        for blocks, thread in self.workers:
+            thread.join()
+        self.workers = []
+
+        return dict(self.results)
+
+def write_sidecar(path: str, size: int, digests: dict, block_crcs):
+    """ Write the digests and per block crc32 values of an image as JSON
+
+    Args:
+        path (str): path of the sidecar file
+        size (int): image size in bytes
+        digests (dict): algorithm -> hex digest
+        block_crcs (list of int): crc32 of every 16 sector block
+    """
+    with open(path, "w") as f:
+        json.dump({"size": size, **digests,
+                   "block_crc32": ["%08x" % crc for crc in block_crcs]}, f, indent=1)
+        f.write("\n")
@@ -0,0 +1,149 @@
+# Copyright (C) 2025     Josh Wood
+# 
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+# Per block record of a dump, stored next to the image (image + ".idx").
+#
+#     header: magic, version, first sector, end sector, number of blocks
+#     record: status, seed, crc32 of the block's user data (one per block)
+#
+# Blocks are the 16 sector ECC blocks of the disc, so the first and last
+# block of a dump that does not start or end on an ECC block boundary
+# hold fewer sectors. Every block is scrambled with a single seed.
+#
+# The records are memory mapped and updated as blocks are written, so an
+# interrupted dump can be resumed by rereading only the blocks that are
+# not VERIFIED, and an image can be checked against the stored CRCs
+# without touching the drive.
+
+import mmap
+import os
+import struct
+import zlib
+
+from . import archive
+from . import commands
+
+MAGIC = b"DVDPYIDX"
+VERSION = 2
+HEADER = struct.Struct("<8sHqqI")
+RECORD = struct.Struct("<BHI")
+
+MISSING = 0
+VERIFIED = 1
+FAILED = 2
+
+NO_SEED = 0xFFFF
+
+BLOCK = commands.SECTORS_PER_BLOCK
+
+class block_index:
+    """ Memory mapped per block status, seed and CRC of a dump
+
+    Parameters:
+        path (str): path of the index file, created when missing or
+            when it describes a different sector range
+        start (int): first sector of the dump
+        end (int): sector after the last sector of the dump
+    """
+    def __init__(self, path: str, start: int, end: int):
+        self.path = path
+        self.start = start
+        self.end = end
+        self.blocks = (end - 1) // BLOCK - start // BLOCK + 1
+        size = HEADER.size + self.blocks * RECORD.size
+
+        header = HEADER.pack(MAGIC, VERSION, start, end, self.blocks)
+        fresh = True
+        if os.path.exists(path) and os.path.getsize(path) == size:
+            with open(path, "rb") as f:
+                fresh = f.read(HEADER.size) != header
+
+        self.file = open(path, "w+b" if fresh else "r+b")
+        if fresh:
+            self.file.write(header)
+            self.file.truncate(size)
+        self.map = mmap.mmap(self.file.fileno(), size)
+
+    @classmethod
+    def load(cls, path: str):
+        """ Open an existing index using the sector range it records """
+        with open(path, "rb") as f:
+            magic, version, start, end, blocks = HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a dump index")
+        return cls(path, start, end)
+
+    def close(self):
+        if self.map is not None:
+            self.map.flush()
+            self.map.close()
+            self.file.close()
+            self.map = None
+
+    def flush(self):
+        self.map.flush()
+
+    def block(self, sector: int):
+        """ Returns the block number holding a sector """
+        return sector // BLOCK - self.start // BLOCK
+
+    def sectors(self, block: int):
+        """ Returns the (first sector, sector after the last) of a block """
+        first = (self.start // BLOCK + block) * BLOCK
+        return max(first, self.start), min(first + BLOCK, self.end)
+
+    def record(self, block: int, status: int, seed: int = None, crc: int = 0):
+        """ Store the result of dumping a block """
+        RECORD.pack_into(self.map, HEADER.size + block * RECORD.size,
+                         status, NO_SEED if seed is None else seed, crc)
+
+    def entry(self, block: int):
+        """ Returns (status, seed or None, crc) of a block """
+        status, seed, crc = RECORD.unpack_from(self.map, HEADER.size + block * RECORD.size)
+        return status, None if seed == NO_SEED else seed, crc
+
+    def pending(self):
+        """ Returns the first sector of every block that is not VERIFIED """
+        return [self.sectors(block)[0] for block in range(self.blocks)
+                if self.entry(block)[0] != VERIFIED]
+
+    def counts(self):
+        """ Returns the number of MISSING, VERIFIED and FAILED blocks """
+        counts = [0, 0, 0]
+        for block in range(self.blocks):
+            counts[self.entry(block)[0]] += 1
+        return {"missing": counts[MISSING], "verified": counts[VERIFIED], "failed": counts[FAILED]}
+
+    def check(self, image: str):
+        """ Compare the image against the CRCs of its verified blocks.
+
+        Args:
+            image (str): path of the image, which may be compressed (see archive)
+
+        Returns:
+            (list of int): first sector of every verified block whose data no longer matches
+        """
+        bad = []
+        with archive.open_image(image) as f:
+            for block in range(self.blocks):
+                status, seed, crc = self.entry(block)
+                if status != VERIFIED:
+                    continue
+                first, last = self.sectors(block)
+                f.seek((first - self.start) * commands.SECTOR_SIZE)
+                if zlib.crc32(f.read((last - first) * commands.SECTOR_SIZE)) != crc:
+                    bad.append(first)
+        return bad
@@ -19,6 +19,17 @@
 # along with this program; if not, write to the Free Software
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from array import array
+from functools import lru_cache
+import sys
+
+from . import ecma_267
+
 def generate_cypher(seed: int, length: int):
     """Generates the cypher used to decode raw DVD data.
 
@@ -57,3 +68,150 @@ def generate_cypher(seed: int, length: int):
             lfsr = ((lfsr << 1) | n) & 0x7FFF
 
     return cypher
+
+# The reference generate_cypher() above steps the register one bit at a
+# time, which is easy to follow but slow. Notice that after 8 steps every
+# feedback bit still only depends on bits of the starting state: the byte
+# shifted out of a state s is simply bits 14-7 of s, and the 8 feedback
+# bits are ((s >> 7) ^ (s >> 3)) & 0xFF. Two byte steps make a word step,
+# so we precompute the 16 output bits and the next state for all 2^15
+# possible states and then advance the register 16 bits per lookup.
+
+STATE_MASK = 0x7FFF
+CACHE_SIZE = 64
+
+def _step_byte(state: int):
+    return ((state << 8) | (((state >> 7) ^ (state >> 3)) & 0xFF)) & STATE_MASK
+
+# word_out[s] = next 16 cypher bits from state s, word_next[s] = state after them
+word_out = [((s >> 7) << 8) | (_step_byte(s) >> 7) for s in range(STATE_MASK + 1)]
+word_next = [_step_byte(_step_byte(s)) for s in range(STATE_MASK + 1)]
+
+def generate_cypher_fast(seed: int, length: int):
+    """Table driven version of generate_cypher() that produces
+    16 cypher bits per step instead of 1.
+
+    Args:
+        seed (int): seed value for the cypher construction
+        length (int): desired length of the cypher in bytes
+
+    Returns:
+        (bytearray)
+    """
+    state = seed & STATE_MASK
+    words = array('H', bytes(2 * ((length + 1) // 2)))
+
+    for i in range(len(words)):
+        words[i] = word_out[state]
+        state = word_next[state]
+
+    if sys.byteorder == 'little':
+        words.byteswap()
+
+    return bytearray(words.tobytes()[:length])
+
+@lru_cache(maxsize=1)
+def word_arrays():
+    """Returns word_out and word_next as numpy uint16 arrays, built once
+
+    Returns:
+        (numpy.ndarray, numpy.ndarray)
+    """
+    return numpy.array(word_out, dtype=numpy.uint16), numpy.array(word_next, dtype=numpy.uint16)
+
+def generate_cyphers(seeds, length: int):
+    """Generates the cyphers for many seeds at once. When numpy is
+    available all registers are stepped together using the same word
+    tables as generate_cypher_fast().
+
+    Args:
+        seeds (list of int): seed values for the cypher constructions
+        length (int): desired length of each cypher in bytes
+
+    Returns:
+        (numpy.ndarray or list of bytearray): uint8 array with shape
+            (len(seeds), length) when numpy is available otherwise a
+            list of cyphers
+    """
+    if numpy is None:
+        return [generate_cypher_fast(seed, length) for seed in seeds]
+
+    out_table, next_table = word_arrays()
+
+    state = numpy.asarray(seeds, dtype=numpy.uint16) & STATE_MASK
+    words = numpy.empty((state.size, (length + 1) // 2), dtype='>u2')
+
+    for i in range(words.shape[1]):
+        words[:, i] = out_table[state]
+        state = next_table[state]
+
+    return words.view(numpy.uint8)[:, :length]
+
+@lru_cache(maxsize=CACHE_SIZE)
+def get_cypher(seed: int, length: int = 2048):
+    """Returns the cypher for a seed, generating it only the first
+    time it is requested. A disc only uses a handful of seeds so the
+    last CACHE_SIZE cyphers are kept for the life of the process.
+
+    Args:
+        seed (int): seed value for the cypher construction
+        length (int, optional): length of the cypher in bytes (default: 2048)
+
+    Returns:
+        (bytes)
+    """
+    return bytes(generate_cypher_fast(seed, length))
+
+# Seed recovery. Both the cypher and the EDC are linear over GF(2): the
+# cypher of seed a ^ b is the cypher of a xor the cypher of b, and the EDC
+# of x ^ y is the EDC of x xor the EDC of y. For a raw sector made of the
+# 12 header bytes, 2048 scrambled bytes and the 4 EDC bytes this gives
+#
+#     calc_edc(header + scrambled) ^ edc == calc_edc(cypher(seed))
+#
+# whenever seed is the one used to scramble the sector. The right hand
+# side only depends on the seed, so we index every seed by it once and
+# recover the seed of any sector with one EDC and one dictionary lookup.
+
+@lru_cache(maxsize=1)
+def seed_index():
+    """Builds the index mapping the EDC of each seed's cypher to the
+    seed. Only the 15 single bit seeds require a cypher and an EDC,
+    the rest are combined from them using linearity.
+
+    Note:
+        Seed 0 is left out. Its cypher is all zeros so it would match
+        any unscrambled sector with a valid EDC, such as an all-zero
+        cache slot, and no disc is scrambled with it.
+
+    Returns:
+        (dict): EDC syndrome -> seed
+    """
+    basis = [ecma_267.calc_edc_fast(generate_cypher_fast(1 << bit, 2048)) for bit in range(15)]
+
+    syndromes = [0] * (STATE_MASK + 1)
+    for seed in range(1, STATE_MASK + 1):
+        low = (seed & -seed).bit_length() - 1
+        syndromes[seed] = syndromes[seed & (seed - 1)] ^ basis[low]
+
+    return {syndrome: seed for seed, syndrome in enumerate(syndromes) if seed != 0}
+
+def recover_seed(raw_sector: bytes):
+    """Finds the seed used to scramble a raw 2064 byte sector.
+
+    Note:
+        Matching the index is equivalent to the descrambled sector
+        passing its EDC check, so no separate verification is needed.
+
+    Args:
+        raw_sector (bytes): raw sector with ID, IED, CPR_MAI, USER DATA, and EDC fields
+
+    Returns:
+        (int or None): the seed, or None when no seed gives a valid EDC
+    """
+    if len(raw_sector) != 2064:
+        raise ValueError("raw sector must be 2064 bytes")
+
+    syndrome = ecma_267.calc_edc_fast(raw_sector[:2060]) ^ int.from_bytes(raw_sector[2060:], 'big')
+
+    return seed_index().get(syndrome)
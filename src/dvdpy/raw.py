@@ -0,0 +1,279 @@
+# Copyright (C) 2025     Josh Wood
+# 
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+# Views of the 2064 byte raw sector layout
+#
+#     offset  size  field
+#          0     4  ID       sector info + physical sector number
+#          4     2  IED      ID error detection code
+#          6     6  CPR_MAI  copyright management information
+#         12  2048  USER     scrambled user data
+#       2060     4  EDC      error detection code over bytes 0 - 2059
+#
+# None of the classes here copy the buffer they wrap, slicing a field
+# returns a memoryview (or numpy view) of the original bytes.
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from functools import lru_cache
+
+from . import ecma_267
+from . import lfsr
+
+RAW_SECTOR_SIZE = 2064
+USER_OFFSET = 12
+USER_SIZE = 2048
+EDC_OFFSET = 2060
+
+# sector information bits in the first ID byte
+LAYER_MASK = 0x01
+ZONE_MASK = 0x0C
+ZONE_SHIFT = 2
+ZONE_DATA = 0
+ZONE_LEAD_IN = 1
+ZONE_LEAD_OUT = 2
+ZONE_MIDDLE = 3
+
+if numpy is not None:
+    sector_dtype = numpy.dtype([
+        ("id", ">u4"),
+        ("ied", ">u2"),
+        ("cpr_mai", "u1", (6,)),
+        ("data", "u1", (USER_SIZE,)),
+        ("edc", ">u4"),
+    ])
+else:
+    sector_dtype = None
+
+class raw_sector:
+    """ Zero copy view of one raw sector
+
+    Parameters:
+        buffer (bytes-like): 2064 bytes, writable to allow descrambling in place
+    """
+    __slots__ = ("view",)
+
+    def __init__(self, buffer):
+        self.view = memoryview(buffer).cast('B')
+        if len(self.view) != RAW_SECTOR_SIZE:
+            raise ValueError("raw sector must be %d bytes" % RAW_SECTOR_SIZE)
+
+    @property
+    def id(self):
+        return self.view[0:4]
+
+    @property
+    def ied(self):
+        return self.view[4:6]
+
+    @property
+    def cpr_mai(self):
+        return self.view[6:USER_OFFSET]
+
+    @property
+    def data(self):
+        return self.view[USER_OFFSET:EDC_OFFSET]
+
+    @property
+    def edc(self):
+        return int.from_bytes(self.view[EDC_OFFSET:], 'big')
+
+    @property
+    def sector_number(self):
+        return int.from_bytes(self.view[1:4], 'big')
+
+    @property
+    def layer(self):
+        return self.view[0] & LAYER_MASK
+
+    @property
+    def zone(self):
+        return (self.view[0] & ZONE_MASK) >> ZONE_SHIFT
+
+    def header_valid(self):
+        """ Returns True when the IED matches the ID """
+        return ecma_267.calc_ied(self.view[0:4]) == int.from_bytes(self.view[4:6], 'big')
+
+    def valid(self):
+        """ Returns True when the EDC matches the (descrambled) sector """
+        return ecma_267.calc_edc_fast(self.view[:EDC_OFFSET]) == self.edc
+
+    def recover_seed(self):
+        """ See lfsr.recover_seed() """
+        return lfsr.recover_seed(self.view)
+
+    def descramble(self, seed: int):
+        """ Descramble the user data in place """
+        data = self.data
+        data[:] = (int.from_bytes(data, 'big') ^
+                   int.from_bytes(lfsr.get_cypher(seed), 'big')).to_bytes(USER_SIZE, 'big')
+
+class raw_block:
+    """ Zero copy view of consecutive raw sectors, such as the buffer
+    filled by read_raw_bytes()
+
+    Parameters:
+        buffer (bytes-like): raw sectors, writable to allow descrambling in place
+        count (int): number of sectors (default: all whole sectors in buffer)
+    """
+    __slots__ = ("view", "count")
+
+    def __init__(self, buffer, count: int = None):
+        self.view = memoryview(buffer).cast('B')
+        if count is None:
+            count = len(self.view) // RAW_SECTOR_SIZE
+        if count * RAW_SECTOR_SIZE > len(self.view):
+            raise ValueError("buffer too small for %d sectors" % count)
+        self.count = count
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index: int):
+        if index < 0:
+            index += self.count
+        if index < 0 or index >= self.count:
+            raise IndexError("sector index out of range")
+        return raw_sector(self.view[index * RAW_SECTOR_SIZE:(index + 1) * RAW_SECTOR_SIZE])
+
+    def __iter__(self):
+        for index in range(self.count):
+            yield self[index]
+
+    def array(self):
+        """ Returns the sectors as a numpy array of sector_dtype sharing the buffer """
+        return numpy.frombuffer(self.view, dtype=sector_dtype, count=self.count)
+
+    def recover_seed(self, skip=()):
+        """ Returns the seed of the first sector with a valid seed, or None
+
+        Args:
+            skip (iterable of int, optional): indices of sectors to ignore,
+                e.g. cache slots known to hold no usable sector (default: none)
+        """
+        skip = set(skip)
+        for index, sector in enumerate(self):
+            if index in skip:
+                continue
+            seed = sector.recover_seed()
+            if seed is not None:
+                return seed
+        return None
+
+    def descramble(self, seeds):
+        """ Descramble the user data of every sector in place. With numpy
+        all sectors are handled by one vectorized xor.
+
+        Args:
+            seeds (int or list of int): one seed for all sectors or one per sector
+        """
+        if isinstance(seeds, int):
+            seeds = [seeds] * self.count
+        if len(seeds) != self.count:
+            raise ValueError("need one seed per sector")
+
+        if numpy is None:
+            for sector, seed in zip(self, seeds):
+                sector.descramble(seed)
+            return
+
+        cyphers = {seed: numpy.frombuffer(lfsr.get_cypher(seed), dtype=numpy.uint8) for seed in set(seeds)}
+        data = self.array()["data"]
+        if len(cyphers) == 1:
+            data ^= cyphers[seeds[0]]
+        else:
+            data ^= numpy.stack([cyphers[seed] for seed in seeds])
+
+    def valid(self):
+        """ Returns a list with True for each sector whose EDC matches """
+        return ecma_267.calc_edc_many(self.view, self.count)
+
+    def user_data(self):
+        """ Returns the 2048 byte user data of all sectors joined together """
+        if numpy is not None:
+            return self.array()["data"].tobytes()
+        return b"".join(bytes(sector.data) for sector in self)
+
+class header_index:
+    """ Decoded ID fields of many raw sectors
+
+    Attributes:
+        sectors (list or numpy.ndarray): physical sector numbers
+        layers (list or numpy.ndarray): layer numbers
+        zones (list or numpy.ndarray): zone types (ZONE_DATA, ZONE_LEAD_IN, ...)
+        valid (list or numpy.ndarray): True where the IED matches the ID
+        offsets (dict): physical sector number -> buffer offset for valid headers
+    """
+    __slots__ = ("sectors", "layers", "zones", "valid", "offsets")
+
+    def __init__(self, sectors, layers, zones, valid, stride: int):
+        self.sectors = sectors
+        self.layers = layers
+        self.zones = zones
+        self.valid = valid
+        self.offsets = {int(sector): i * stride
+                        for i, (sector, ok) in enumerate(zip(sectors, valid)) if ok}
+
+    def __len__(self):
+        return len(self.sectors)
+
+    def offset(self, sector: int):
+        """ Returns the buffer offset of a physical sector, or None """
+        return self.offsets.get(sector)
+
+def parse_headers(buffer, count: int, stride: int = RAW_SECTOR_SIZE):
+    """ Decode and check the ID and IED fields of many raw sectors.
+
+    Args:
+        buffer (bytes-like): buffer holding the raw sectors
+        count (int): number of sectors
+        stride (int, optional): bytes from the start of one sector to the next (default: 2064)
+
+    Returns:
+        (header_index): sector numbers, layers, zones, validity and offsets
+    """
+    view = memoryview(buffer).cast('B')
+    if count > 0 and len(view) < (count - 1) * stride + 6:
+        raise ValueError("buffer too small for %d sectors" % count)
+
+    if numpy is None:
+        headers = [view[i * stride:i * stride + 6] for i in range(count)]
+        return header_index(
+            [int.from_bytes(h[1:4], 'big') for h in headers],
+            [h[0] & LAYER_MASK for h in headers],
+            [(h[0] & ZONE_MASK) >> ZONE_SHIFT for h in headers],
+            [ecma_267.calc_ied(h) == int.from_bytes(h[4:6], 'big') for h in headers],
+            stride)
+
+    headers = numpy.ndarray((count, 6), dtype=numpy.uint8, buffer=view, strides=(stride, 1))
+    words = headers.astype(numpy.uint32)
+    tables = ied_arrays()
+
+    ied = tables[0][words[:, 0]] ^ tables[1][words[:, 1]] ^ tables[2][words[:, 2]] ^ tables[3][words[:, 3]]
+    return header_index(
+        (words[:, 1] << 16) | (words[:, 2] << 8) | words[:, 3],
+        words[:, 0] & LAYER_MASK,
+        (words[:, 0] & ZONE_MASK) >> ZONE_SHIFT,
+        ied == ((words[:, 4] << 8) | words[:, 5]),
+        stride)
+
+@lru_cache(maxsize=1)
+def ied_arrays():
+    """ Returns ecma_267.ied_tables as numpy arrays """
+    return [numpy.array(table, dtype=numpy.uint32) for table in ecma_267.ied_tables]
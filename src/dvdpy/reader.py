@@ -0,0 +1,166 @@
+# Copyright (C) 2025     Josh Wood
+# 
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+import io
+from collections import OrderedDict
+
+from . import commands
+
+BLOCK_SIZE = commands.SECTORS_PER_BLOCK * commands.SECTOR_SIZE
+
+class disc_reader(io.RawIOBase):
+    """ Random access, file-like view of the user data on a disc.
+
+    Data is read in 16 sector ECC blocks kept in an LRU cache limited to
+    cache_size bytes. Sequential access grows a read-ahead window so that
+    several blocks are fetched by one READ_12, random access shrinks it
+    back to a single block.
+
+    Parameters:
+        drive (devices.dvd): the drive to read from
+        sectors (int): number of sectors on the disc (None when unknown)
+        cache_size (int): memory budget of the block cache in bytes
+        read_ahead (int): largest read-ahead window in blocks
+    """
+    def __init__(self, drive, sectors: int = None, cache_size: int = 8 << 20,
+                 read_ahead: int = 8):
+        super().__init__()
+        self.drive = drive
+        self.size = sectors * commands.SECTOR_SIZE if sectors is not None else None
+        self.cache_size = cache_size
+        self.read_ahead = max(1, read_ahead)
+        self.blocks = OrderedDict()
+        self.cached_bytes = 0
+        self.position = 0
+        self.window = 1
+        self.last_block = None
+        self.hits = 0
+        self.misses = 0
+        self.commands = 0
+        self.prefetched = 0
+        self.evictions = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            position = offset
+        elif whence == io.SEEK_CUR:
+            position = self.position + offset
+        elif whence == io.SEEK_END:
+            if self.size is None:
+                raise io.UnsupportedOperation("disc size is unknown")
+            position = self.size + offset
+        else:
+            raise ValueError("invalid whence")
+        if position < 0:
+            raise ValueError("negative seek position")
+        self.position = position
+        return position
+
+    def stats(self):
+        """ Returns the cache hit/miss statistics as a dict """
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "commands": self.commands,
+            "prefetched": self.prefetched,
+            "evictions": self.evictions,
+            "cached_blocks": len(self.blocks),
+            "cached_bytes": self.cached_bytes,
+        }
+
+    def _store(self, block: int, data: bytes):
+        if block in self.blocks:
+            self.cached_bytes -= len(self.blocks.pop(block))
+        self.blocks[block] = data
+        self.cached_bytes += len(data)
+        while self.cached_bytes > self.cache_size and len(self.blocks) > 1:
+            _, evicted = self.blocks.popitem(last=False)
+            self.cached_bytes -= len(evicted)
+            self.evictions += 1
+
+    def _fetch(self, block: int):
+        # sequential access doubles the read-ahead window, random access resets it
+        if self.last_block is not None and block == self.last_block + 1:
+            self.window = min(self.window * 2, self.read_ahead)
+        else:
+            self.window = 1
+
+        # never read ahead more than half the cache can hold
+        count = max(1, min(self.window, self.cache_size // BLOCK_SIZE // 2))
+        while count > 1 and (block + count - 1) in self.blocks:
+            count -= 1
+        if self.size is not None:
+            last = (self.size - 1) // BLOCK_SIZE
+            count = max(1, min(count, last - block + 1))
+        sectors = count * commands.SECTORS_PER_BLOCK
+        if self.size is not None:
+            sectors = min(sectors, self.size // commands.SECTOR_SIZE - block * commands.SECTORS_PER_BLOCK)
+
+        self.commands += 1
+        status, buffer = self.drive.read_sectors(block * commands.SECTORS_PER_BLOCK, sectors)
+        if status < 0:
+            raise OSError(f"read of block {block} failed")
+
+        # store the requested block last so read-ahead never evicts it
+        for i in range(1, count):
+            if block + i not in self.blocks:
+                self.prefetched += 1
+                self._store(block + i, bytes(buffer[i * BLOCK_SIZE:(i + 1) * BLOCK_SIZE]))
+
+        data = bytes(buffer[:BLOCK_SIZE])
+        self._store(block, data)
+        return data
+
+    def _block(self, block: int):
+        data = self.blocks.get(block)
+        if data is not None:
+            self.hits += 1
+            self.blocks.move_to_end(block)
+        else:
+            self.misses += 1
+            data = self._fetch(block)
+        self.last_block = block
+        return data
+
+    def readinto(self, buffer):
+        view = memoryview(buffer).cast('B')
+        n = len(view)
+        if self.size is not None:
+            n = max(0, min(n, self.size - self.position))
+
+        done = 0
+        while done < n:
+            block, offset = divmod(self.position, BLOCK_SIZE)
+            data = self._block(block)
+            chunk = min(n - done, len(data) - offset)
+            if chunk <= 0:
+                break
+            view[done:done + chunk] = data[offset:offset + chunk]
+            done += chunk
+            self.position += chunk
+
+        return done
@@ -0,0 +1,134 @@
+# Copyright (C) 2025     Josh Wood
+# 
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+# Targeted rereads of sectors that failed their EDC check. Failing sectors
+# are batched into one window per ECC block (one cache fill each), and
+# every window is reread until each of its sectors has been recovered
+# once or the retries run out. Attempts alternate between
+# streaming reads and force unit access (FUA) reads, which make the drive
+# go back to the media instead of serving its cache, and back off between
+# attempts. The first copy of a sector with a valid EDC is kept.
+
+import time
+
+from . import commands
+from . import raw
+from . import scheduler
+
+RAW = commands.RAW_SECTOR_SIZE
+BLOCK = commands.SECTORS_PER_BLOCK
+
+def plan_windows(sectors, size: int = BLOCK):
+    """ Batch sectors into one window per ECC block of size sectors. Each
+    window starts on the ECC block boundary and ends at its last failing
+    sector, so rereads fill the cache exactly like the dump did and never
+    ask for sectors past the last failing one (or the end of the disc).
+
+    Args:
+        sectors (iterable of int): failing sectors
+        size (int, optional): sectors per ECC block (default: 16)
+
+    Returns:
+        (list of (int, int)): (first sector, count) of each window
+    """
+    last = {}
+    for sector in sectors:
+        block = sector // size
+        last[block] = max(last.get(block, sector), sector)
+    return [(block * size, last[block] - block * size + 1) for block in sorted(last)]
+
+class retry_engine:
+    """ Rereads failing sectors and keeps a per sector damage map
+
+    Parameters:
+        drive (devices.dvd): the drive to read from
+        retries (int): attempts per window
+        backoff (float): seconds to wait before the second attempt, doubled for each further attempt
+        slow_down (callable): called without arguments before the attempt
+            given by slow_after, e.g. to reduce the spindle speed
+        slow_after (int): attempt after which slow_down is called
+        cache (scheduler.cache_scheduler): scheduler shared with other reads
+            of the drive, a new one by default
+    """
+    def __init__(self, drive, retries: int = 4, backoff: float = 0.05,
+                 slow_down=None, slow_after: int = 2, cache=None):
+        self.drive = drive
+        self.cache = scheduler.cache_scheduler(drive) if cache is None else cache
+        self.retries = retries
+        self.backoff = backoff
+        self.slow_down = slow_down
+        self.slow_after = slow_after
+        self.failing = set()
+        self.attempts = {}    # sector -> rereads made
+        self.recovered = {}   # sector -> (user data, seed)
+
+    def record(self, sectors):
+        """ Record sectors that failed their EDC check """
+        for sector in sectors:
+            if sector not in self.recovered:
+                self.failing.add(sector)
+
+    def damage_map(self):
+        """ Returns the rereads made for every sector that needed them,
+        negative for sectors that were never recovered
+        """
+        return {sector: attempts if sector in self.recovered else -attempts
+                for sector, attempts in sorted(self.attempts.items())}
+
+    def run(self):
+        """ Reread every recorded failing sector. Sectors still failing
+        once the retries run out are given up, so the next run only
+        rereads the sectors recorded after this one.
+
+        Returns:
+            (dict): sector -> (user data, seed) of the sectors recovered by this run
+        """
+        recovered = {}
+        slowed = False
+        buffer = bytearray(BLOCK * RAW)
+
+        for attempt in range(self.retries):
+            if not self.failing:
+                break
+            if attempt > 0 and self.backoff > 0:
+                time.sleep(self.backoff * (1 << (attempt - 1)))
+            if self.slow_down is not None and not slowed and attempt >= self.slow_after:
+                self.slow_down()
+                slowed = True
+
+            for first, count in plan_windows(self.failing):
+                missing = set(self.cache.read(first, count, buffer, streaming=attempt % 2 == 0, refill=True))
+                block = raw.raw_block(buffer, count)
+
+                for i in range(count):
+                    sector = first + i
+                    if sector not in self.failing:
+                        continue
+                    self.attempts[sector] = self.attempts.get(sector, 0) + 1
+                    if i in missing:
+                        continue
+
+                    # a seed is only found when the descrambled EDC is valid
+                    seed = block[i].recover_seed()
+                    if seed is None:
+                        continue
+                    block[i].descramble(seed)
+                    recovered[sector] = (bytes(block[i].data), seed)
+                    self.recovered[sector] = recovered[sector]
+                    self.failing.discard(sector)
+
+        self.failing.clear()
+        return recovered
@@ -0,0 +1,248 @@
+# Copyright (C) 2025     Josh Wood
+# 
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+# The drive keeps raw sectors in a ring of CACHE_SECTORS 2064 byte slots
+# starting at HITACHI_MEM_BASE. A streaming read fills some of the slots
+# and may also leave read-ahead sectors behind it. The ID field at the
+# start of every raw sector holds its physical sector number, so reading
+# the IDs tells us exactly which sector sits in which slot.
+
+from . import commands
+from . import raw
+
+RAW = commands.RAW_SECTOR_SIZE
+CACHE_SECTORS = 80
+MAX_TRANSFER = 65535
+SECTORS_PER_TRANSFER = MAX_TRANSFER // RAW
+
+# physical sector number of user sector 0
+PSN_OFFSET = 0x30000
+
+def sector_number(raw, offset: int = 0):
+    """ Read the physical sector number from the ID field of a raw sector.
+
+    Args:
+        raw (bytes-like): buffer holding raw sectors
+        offset (int, optional): offset of the raw sector in raw (default: 0)
+
+    Returns:
+        (int): 24 bit physical sector number
+    """
+    return int.from_bytes(raw[offset + 1:offset + 4], 'big')
+
+def plan_reads(slot: int, count: int, cache_sectors: int = CACHE_SECTORS,
+               max_sectors: int = SECTORS_PER_TRANSFER):
+    """ Plan the fewest memory reads that pull count consecutive sectors
+    starting at slot out of the cache ring exactly once.
+
+    Args:
+        slot (int): slot of the first sector
+        count (int): number of sectors
+        cache_sectors (int, optional): number of slots in the ring (default: 80)
+        max_sectors (int, optional): sectors allowed per read (default: 31)
+
+    Returns:
+        (list of (int, int)): (slot, sectors) for each read in order
+    """
+    if count > cache_sectors:
+        raise ValueError("more sectors requested than the cache holds")
+
+    plan = []
+    while count > 0:
+        # never read past the end of the ring, wrap to slot 0 instead
+        n = min(count, max_sectors, cache_sectors - slot)
+        plan.append((slot, n))
+        slot = (slot + n) % cache_sectors
+        count -= n
+
+    return plan
+
+class cache_scheduler:
+    """ Reads raw sectors from the drive cache with as few commands as
+    possible by remembering which sectors the cache already holds.
+
+    Parameters:
+        drive (devices.dvd): the drive to read from
+        cache_sectors (int): number of raw sector slots in the cache
+    """
+    def __init__(self, drive, cache_sectors: int = CACHE_SECTORS):
+        self.drive = drive
+        self.cache_sectors = cache_sectors
+        self.cache = bytearray(cache_sectors * RAW)
+        self.fill_slot = 0   # slot a streaming read places its first sector in
+        self.fill_count = commands.SECTORS_PER_BLOCK  # sectors a streaming read leaves cached
+        self.window = None   # (first sector, slot, count) known to be cached
+        self.discovered = False
+        self.prefetched = None   # (sector, ticket, buffer) of a fill issued ahead
+        self.commands = 0
+
+    def _prefetch(self, sector: int, count: int):
+        # the drive runs commands in order, so this fill only starts after
+        # the memory reads already submitted have emptied the cache
+        self.commands += 1
+        buffer = bytearray(count * commands.SECTOR_SIZE)
+        cmd = commands.read_12_command(sector, count, True)
+        self.prefetched = (sector, self.drive.submit(cmd, buffer), buffer)
+
+    def drain(self):
+        """ Wait for a fill issued ahead of time (see read()) and return its
+        sector and status, or None when there is none
+        """
+        if self.prefetched is None:
+            return None
+        sector, ticket, buffer = self.prefetched
+        self.prefetched = None
+        return sector, self.drive.wait(ticket).status
+
+    def _fill(self, sector: int, count: int, streaming: bool = True):
+        # only the sectors asked for are requested, so a fill never runs
+        # past the end of the disc, the drive may still cache more
+        drained = self.drain()
+        if drained is not None and drained[0] == sector and streaming:
+            return drained[1]
+
+        self.commands += 1
+        status, _ = self.drive.read_sectors(sector, count, streaming=streaming,
+                                            buffer=bytearray(count * commands.SECTOR_SIZE))
+        return status
+
+    def _read(self, plan, buffer, prefetch=None):
+        # issue every memory read of the plan, and the fill of the next
+        # block, before waiting on any of them so transports that queue
+        # commands keep the drive busy
+        view = memoryview(buffer).cast('B')
+        tickets = []
+        position = 0
+        for slot, n in plan:
+            self.commands += 1
+            cmd = commands.read_memory_command(slot * RAW, n * RAW)
+            tickets.append(self.drive.submit(cmd, view[position:position + n * RAW]))
+            position += n * RAW
+
+        if prefetch is not None and self.prefetched is None:
+            self._prefetch(*prefetch)
+
+        status = 0
+        for ticket in tickets:
+            status = min(status, self.drive.wait(ticket).status)
+        return status
+
+    def discover(self, sector: int, count: int = commands.SECTORS_PER_BLOCK):
+        """ Fill the cache at sector and read back every slot to learn
+        where the sector landed and how many consecutive sectors follow.
+
+        Args:
+            sector (int): user sector to fill the cache with
+            count (int, optional): sectors to fill, at least 1 (default: 16)
+
+        Returns:
+            (int, int): (slot, count), count is 0 when the sector was not found
+        """
+        # a failed fill can still leave the raw sectors in the cache, the
+        # IDs and EDCs of what is read back decide what is usable
+        self.window = None
+        self._fill(sector, count)
+        if self._read(plan_reads(0, self.cache_sectors, self.cache_sectors), self.cache) < 0:
+            return 0, 0
+
+        # slots whose IED does not match hold no usable sector
+        headers = raw.parse_headers(self.cache, self.cache_sectors)
+        psn = sector + PSN_OFFSET
+        if headers.offset(psn) is None:
+            return 0, 0
+
+        slot = headers.offset(psn) // RAW
+        count = 1
+        while count < self.cache_sectors and headers.offset(psn + count) == ((slot + count) % self.cache_sectors) * RAW:
+            count += 1
+
+        self.fill_slot = slot
+        self.fill_count = count
+        self.discovered = True
+        self.window = (sector, slot, count)
+        return slot, count
+
+    def cached(self, sector: int, count: int):
+        """ Returns True when sectors [sector, sector + count) are known to be cached """
+        if self.window is None:
+            return False
+        first, slot, n = self.window
+        return first <= sector and sector + count <= first + n
+
+    def read(self, sector: int, count: int, buffer, streaming: bool = True, refill: bool = False,
+             prefetch=None):
+        """ Read count raw sectors starting at user sector into buffer,
+        filling the cache only when the sectors are not already there.
+
+        Note:
+            The ID of every sector read is checked, so sectors left over
+            from an older fill or overwritten by the ring wrapping around
+            are never returned as valid.
+
+        Args:
+            sector (int): first user sector
+            count (int): number of sectors
+            buffer (writable bytes-like): receives count * 2064 bytes
+            streaming (bool, optional): fill with a streaming read, False
+                forces the drive to reread the media (default: True)
+            refill (bool, optional): fill even when the sectors are cached (default: False)
+            prefetch (tuple of int, optional): (sector, count) of the next
+                read, its streaming fill is issued right behind this read's
+                memory reads when it is not cached already (default: None)
+
+        Returns:
+            (list of int): indices (0 to count - 1) of sectors that could not be read
+        """
+        if count > commands.SECTORS_PER_BLOCK:
+            raise ValueError("at most %d sectors per read" % commands.SECTORS_PER_BLOCK)
+
+        stale = list(range(count))
+        for attempt in range(2):
+            if (refill and attempt == 0) or not self.cached(sector, count):
+                if attempt == 0 and self.discovered:
+                    # assume the fill lands where the last discovered one did,
+                    # even a failed fill is read back since damaged sectors
+                    # may still be cached
+                    self._fill(sector, count, streaming)
+                    self.window = (sector, self.fill_slot, self.fill_count)
+                else:
+                    self.discover(sector, count)
+                    if not self.cached(sector, count):
+                        return stale
+
+            first, slot, n = self.window
+            slot = (slot + sector - first) % self.cache_sectors
+            ahead = None
+            if prefetch is not None and self.discovered and not self.cached(*prefetch):
+                ahead = prefetch
+            if self._read(plan_reads(slot, count, self.cache_sectors), buffer, ahead) < 0:
+                self.window = None
+                stale = list(range(count))
+                continue
+
+            if ahead is not None:
+                # the fill issued ahead replaces what the cache holds
+                self.window = None
+
+            psn = sector + PSN_OFFSET
+            stale = [i for i in range(count) if sector_number(buffer, i * RAW) != psn + i]
+            if not stale:
+                return []
+
+            # the cache did not hold what we expected so learn it again
+            self.window = None
+
+        return stale
@@ -0,0 +1,127 @@
+# Copyright (C) 2025     Josh Wood
+# 
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+import threading
+import time
+
+OPCODE_NAMES = {
+    0x12: "INQUIRY",
+    0x1B: "START_STOP",
+    0xA8: "READ_12",
+    0xB6: "SET_STREAMING",
+    0xBB: "SET_CD_SPEED",
+    0xE7: "HIT_READ_MEMORY",
+}
+
+# latency bucket i counts commands taking less than 2^i microseconds
+LATENCY_BUCKETS = 25
+
+class histogram:
+    """ Latency histogram with power of two buckets in microseconds """
+    __slots__ = ("counts", "count", "total", "min", "max")
+
+    def __init__(self):
+        self.counts = [0] * LATENCY_BUCKETS
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, latency: float):
+        bucket = min(int(latency * 1e6).bit_length(), LATENCY_BUCKETS - 1)
+        self.counts[bucket] += 1
+        self.count += 1
+        self.total += latency
+        self.min = latency if self.min is None else min(self.min, latency)
+        self.max = latency if self.max is None else max(self.max, latency)
+
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, fraction: float):
+        """ Upper bound in seconds of the bucket holding the percentile """
+        target = fraction * self.count
+        seen = 0
+        for bucket, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= target:
+                return (1 << bucket) * 1e-6
+        return 0.0
+
+class telemetry:
+    """ Counters, per opcode latency histograms and error tallies
+    for the commands sent to one drive.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.started = time.monotonic()
+            self.commands = 0
+            self.failures = 0
+            self.bytes = 0
+            self.latency = {}
+            self.errors = {}
+
+    def record(self, opcode: int, nbyte: int, result):
+        """ Record a completed command.
+
+        Args:
+            opcode (int): first command byte
+            nbyte (int): number of bytes transferred
+            result (CommandResult): status, sense data and latency
+        """
+        with self.lock:
+            self.commands += 1
+            self.latency.setdefault(opcode, histogram()).add(result.latency)
+
+            if result.status < 0 or result.sense_key != 0:
+                self.failures += 1
+                key = (opcode, result.sense_key, result.asc, result.ascq)
+                self.errors[key] = self.errors.get(key, 0) + 1
+            else:
+                self.bytes += nbyte
+
+    def summary(self):
+        """ Summarize the recorded commands.
+
+        Returns:
+            (dict): totals, throughput, per opcode latency and errors
+        """
+        with self.lock:
+            elapsed = time.monotonic() - self.started
+            return {
+                "elapsed": elapsed,
+                "commands": self.commands,
+                "failures": self.failures,
+                "bytes": self.bytes,
+                "mb_per_s": self.bytes / elapsed / 1e6 if elapsed > 0 else 0.0,
+                "latency": {
+                    OPCODE_NAMES.get(opcode, "0x%02X" % opcode): {
+                        "count": hist.count,
+                        "mean": hist.mean(),
+                        "min": hist.min,
+                        "max": hist.max,
+                        "p50": hist.percentile(0.5),
+                        "p99": hist.percentile(0.99),
+                        "buckets": list(hist.counts),
+                    } for opcode, hist in self.latency.items()},
+                "errors": {
+                    "%s %02X/%02X/%02X" % (OPCODE_NAMES.get(opcode, "0x%02X" % opcode), key, asc, ascq): count
+                    for (opcode, key, asc, ascq), count in self.errors.items()},
+            }
@@ -0,0 +1,384 @@
+# Copyright (C) 2025     Josh Wood
+# 
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+# A transport carries 12 byte commands to a drive and fills the returned
+# bytes into a buffer. devices.dvd talks to the drive only through its
+# transport, so the real drive can be swapped for a simulated one.
+#
+# Every transport provides:
+#
+#     execute(cmd, buffer, timeout, verbose) -> commands.CommandResult
+#     submit(cmd, buffer, timeout) -> ticket
+#     wait(ticket) -> commands.CommandResult
+#     close()
+#
+# submit() starts a command and wait() collects its result. Only the sg
+# transport keeps several commands in flight, the others complete the
+# command inside submit().
+
+import glob
+import mmap
+import os
+import random
+import threading
+import time
+
+from . import cextension
+from . import commands
+from . import raw
+
+# sense key, asc, ascq
+SENSE_OK = (0x00, 0x00, 0x00)
+SENSE_NOT_READY = (0x02, 0x04, 0x02)
+SENSE_MEDIUM_ERROR = (0x03, 0x11, 0x00)
+SENSE_INVALID_OPCODE = (0x05, 0x20, 0x00)
+SENSE_OUT_OF_RANGE = (0x05, 0x21, 0x00)
+SENSE_INVALID_FIELD = (0x05, 0x24, 0x00)
+
+class linux_transport:
+    """ Transport for a real drive using the Linux CDROM_SEND_PACKET ioctl
+
+    Parameters:
+        address (str): path to drive
+    """
+    def __init__(self, address: str):
+        self.fd = cextension.open_device(address)
+
+    def execute(self, cmd: bytes, buffer, timeout: int = 1, verbose: bool = False):
+        return commands.send_command(self.fd, cmd, buffer, timeout, verbose)
+
+    def submit(self, cmd: bytes, buffer, timeout: int = 1):
+        return self.execute(cmd, buffer, timeout)
+
+    def wait(self, ticket):
+        return ticket
+
+    def close(self):
+        if self.fd >= 0:
+            cextension.close_device(self.fd)
+            self.fd = -1
+
+def find_sg(address: str):
+    """ Find the sg device of a drive, e.g. /dev/sg1 for /dev/sr0
+
+    Args:
+        address (str): path to drive
+
+    Returns:
+        (str or None): path to the sg device, None when there is none
+    """
+    if os.path.basename(address).startswith("sg"):
+        return address if os.path.exists(address) else None
+
+    name = os.path.basename(os.path.realpath(address))
+    for path in glob.glob(f"/sys/block/{name}/device/scsi_generic/sg*"):
+        device = "/dev/" + os.path.basename(path)
+        if os.path.exists(device):
+            return device
+    return None
+
+class sg_transport:
+    """ Transport using the Linux sg driver. Commands are submitted with
+    write() and collected with read() so that up to depth commands can be
+    in flight, e.g. the next memory read is issued while the current one
+    completes.
+
+    Parameters:
+        address (str): path to the drive (/dev/sr0) or its sg device (/dev/sg1)
+        depth (int): maximum number of commands in flight
+    """
+    def __init__(self, address: str, depth: int = 4):
+        path = find_sg(address)
+        if path is None:
+            raise FileNotFoundError(f"no sg device for {address}")
+        self.fd = os.open(path, os.O_RDWR)
+        self.depth = max(1, depth)
+        self.lock = threading.Lock()
+        self.next_id = 0
+        self.pending = {}   # pack id -> request capsule
+        self.done = {}      # pack id -> CommandResult
+
+    def _receive(self):
+        # collect the next command to complete, the lock must be held
+        pack_id, status, sense_key, asc, ascq, duration = cextension.sg_receive(self.fd)
+        # latency is the duration measured by the sg driver, in milliseconds
+        self.pending.pop(pack_id)
+        self.done[pack_id] = commands.CommandResult(status, sense_key, asc, ascq,
+                                                    duration * 1e-3)
+
+    def submit(self, cmd: bytes, buffer, timeout: int = 1):
+        with self.lock:
+            # a full queue collects the oldest command instead of blocking,
+            # so submitting more than depth commands before waiting is safe
+            while len(self.pending) >= self.depth:
+                self._receive()
+
+            pack_id = self.next_id
+            self.next_id = (self.next_id + 1) & 0x7FFFFFFF
+            request = cextension.sg_submit(self.fd, cmd, buffer, timeout, pack_id,
+                                           cmd[0] in commands.DATA_OUT_OPCODES)
+            self.pending[pack_id] = request
+        return pack_id
+
+    def wait(self, ticket):
+        with self.lock:
+            while ticket not in self.done:
+                self._receive()
+            return self.done.pop(ticket)
+
+    def execute(self, cmd: bytes, buffer, timeout: int = 1, verbose: bool = False):
+        result = self.wait(self.submit(cmd, buffer, timeout))
+        if verbose:
+            print("Executing MMC command: " + " ".join("%02x%02x" % (cmd[2 * i], cmd[2 * i + 1]) for i in range(6)))
+            print("Sense data: %02X/%02X/%02X (status %d)" % (result.sense_key, result.asc, result.ascq, result.status))
+        return result
+
+    def close(self):
+        if self.fd >= 0:
+            with self.lock:
+                while self.pending:
+                    pack_id = cextension.sg_receive(self.fd)[0]
+                    self.pending.pop(pack_id, None)
+            os.close(self.fd)
+            self.fd = -1
+
+def open_transport(address: str, mode: str = "auto", depth: int = 4):
+    """ Open a transport for a real drive.
+
+    Args:
+        address (str): path to drive
+        mode (str, optional): "sg" for the queued sg transport, "ioctl" for
+            CDROM_SEND_PACKET, or "auto" to use sg when available (default: "auto")
+        depth (int, optional): commands in flight for the sg transport (default: 4)
+
+    Returns:
+        (sg_transport or linux_transport)
+    """
+    if mode not in ("auto", "sg", "ioctl"):
+        raise ValueError("mode must be auto, sg or ioctl")
+
+    if mode != "ioctl":
+        try:
+            return sg_transport(address, depth)
+        except OSError:
+            if mode == "sg":
+                raise
+
+    return linux_transport(address)
+
+class simulated_transport:
+    """ Transport emulating a GDR-8164B drive from a scrambled image made
+    of raw 2064 byte sectors (for example the test.bin written by test.py).
+
+    READ_12 returns descrambled user data and leaves the raw sectors in an
+    emulated cache of cache_sectors slots that the vendor 0xE7 memory read
+    serves from. SET CD SPEED and SET STREAMING limit the transfer rate.
+    Timing and errors are configurable so throughput can be measured
+    reproducibly without hardware.
+
+    Parameters:
+        path (str): path to the scrambled raw image
+        first_sector (int): user sector of the first raw sector in the image
+        latency (float): seconds added to every command
+        seek_cost (float): seconds added to a READ_12 that is not sequential
+        transfer_rate (float): bytes per second for data transfers (0 = instant)
+        fill_slot (int): cache slot that receives the first sector of a fill
+        read_ahead (int): sectors cached by a fill (at least the sectors read)
+        cache_sectors (int): number of raw sector slots in the cache
+        bad_sectors (dict): user sector -> number of READ_12 failures to inject,
+            the raw sectors are still cached by a failing read
+        corrupt_sectors (dict): user sector -> number of fills caching a corrupted copy
+        weak_sectors (dict): user sector -> fastest speed in kB/s at which
+            it is cached intact, faster fills cache a corrupted copy
+        error_rate (float): probability of a random READ_12 medium error
+        seed (int): random seed for error_rate
+    """
+    vendor = b"HL-DT-ST"
+    product = b"DVD-ROM GDR8164B"
+    revision = b"0L06"
+
+    def __init__(self, path: str, first_sector: int = 0, latency: float = 0.0,
+                 seek_cost: float = 0.0, transfer_rate: float = 0.0, fill_slot: int = 0,
+                 read_ahead: int = commands.SECTORS_PER_BLOCK, cache_sectors: int = 80,
+                 bad_sectors: dict = None, corrupt_sectors: dict = None,
+                 weak_sectors: dict = None, error_rate: float = 0.0, seed: int = 0):
+        self.file = open(path, "rb")
+        self.image = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.sectors = len(self.image) // commands.RAW_SECTOR_SIZE
+        self.first_sector = first_sector
+        self.latency = latency
+        self.seek_cost = seek_cost
+        self.transfer_rate = transfer_rate
+        self.fill_slot = fill_slot
+        self.read_ahead = read_ahead
+        self.cache_sectors = cache_sectors
+        self.cache = bytearray(cache_sectors * commands.RAW_SECTOR_SIZE)
+        self.bad_sectors = dict(bad_sectors or {})
+        self.corrupt_sectors = dict(corrupt_sectors or {})
+        self.weak_sectors = dict(weak_sectors or {})
+        self.speed = commands.MAX_SPEED
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.spinning = True
+        self.position = None
+        self.lock = threading.Lock()
+
+    def close(self):
+        if self.image is not None:
+            self.image.close()
+            self.file.close()
+            self.image = None
+
+    def raw_sector(self, sector: int):
+        """ Returns the raw 2064 bytes of a user sector from the image """
+        index = sector - self.first_sector
+        return self.image[index * commands.RAW_SECTOR_SIZE:(index + 1) * commands.RAW_SECTOR_SIZE]
+
+    def execute(self, cmd: bytes, buffer, timeout: int = 1, verbose: bool = False):
+        view = memoryview(buffer).cast('B')
+
+        with self.lock:
+            handler = {
+                commands.SPC_INQUIRY: self._inquiry,
+                commands.SBC_START_STOP: self._start_stop,
+                commands.MMC_READ_12: self._read_12,
+                commands.MMC_SET_STREAMING: self._set_streaming,
+                commands.MMC_SET_CD_SPEED: self._set_cd_speed,
+                commands.HIT_READ_MEMORY: self._read_memory,
+            }.get(cmd[0])
+
+            if handler is None:
+                sense, delay = SENSE_INVALID_OPCODE, self.latency
+            else:
+                sense, delay = handler(cmd, view)
+
+        if delay > 0:
+            time.sleep(delay)
+
+        if verbose:
+            print("Executing MMC command: " + " ".join("%02x%02x" % (cmd[2 * i], cmd[2 * i + 1]) for i in range(6)))
+            print("Sense data: %02X/%02X/%02X (status %d)" % (*sense, 0 if sense == SENSE_OK else -1))
+
+        return commands.CommandResult(0 if sense == SENSE_OK else -1, *sense, delay)
+
+    def submit(self, cmd: bytes, buffer, timeout: int = 1):
+        return self.execute(cmd, buffer, timeout)
+
+    def wait(self, ticket):
+        return ticket
+
+    def _transfer_time(self, nbyte: int):
+        if self.transfer_rate <= 0:
+            return 0.0
+        return nbyte / min(self.transfer_rate, self.speed * 1000)
+
+    def _inquiry(self, cmd, view):
+        reply = bytearray(36)
+        reply[0] = 0x05 # CD/DVD device
+        reply[8:16] = self.vendor
+        reply[16:32] = self.product
+        reply[32:36] = self.revision
+        n = min(len(view), len(reply))
+        view[:n] = reply[:n]
+        return SENSE_OK, self.latency
+
+    def _start_stop(self, cmd, view):
+        self.spinning = bool(cmd[4] & 1)
+        self.position = None
+        return SENSE_OK, self.latency
+
+    def _set_cd_speed(self, cmd, view):
+        self.speed = int.from_bytes(cmd[2:4], 'big')
+        return SENSE_OK, self.latency
+
+    def _set_streaming(self, cmd, view):
+        nbyte = int.from_bytes(cmd[9:11], 'big')
+        if cmd[8] != 0 or nbyte < commands.STREAMING_DESCRIPTOR_SIZE or len(view) < nbyte:
+            return SENSE_INVALID_FIELD, self.latency
+
+        size = int.from_bytes(view[12:16], 'big')
+        time_ms = int.from_bytes(view[16:20], 'big')
+        if view[0] & 0x04:
+            self.speed = commands.MAX_SPEED
+        elif time_ms == 0:
+            return SENSE_INVALID_FIELD, self.latency
+        else:
+            self.speed = max(1, min(commands.MAX_SPEED, size * 1000 // time_ms))
+        return SENSE_OK, self.latency
+
+    def _read_12(self, cmd, view):
+        if not self.spinning:
+            return SENSE_NOT_READY, self.latency
+
+        sector = int.from_bytes(cmd[2:6], 'big')
+        count = int.from_bytes(cmd[6:10], 'big')
+        streaming = bool(cmd[10] & 0x80)
+        if len(view) < count * commands.SECTOR_SIZE:
+            return SENSE_INVALID_FIELD, self.latency
+        if sector < self.first_sector or sector + count > self.first_sector + self.sectors:
+            return SENSE_OUT_OF_RANGE, self.latency
+
+        delay = self.latency + self._transfer_time(count * commands.SECTOR_SIZE)
+        if self.position != sector:
+            delay += self.seek_cost
+        self.position = sector + count
+
+        # cache the raw sectors, reading ahead past the request. Like the
+        # real drive the cache is filled even when the read then fails.
+        total = min(max(count, self.read_ahead), self.cache_sectors, self.first_sector + self.sectors - sector)
+        copies = []
+        for i in range(total):
+            slot = (self.fill_slot + i) % self.cache_sectors
+            data = bytearray(self.raw_sector(sector + i))
+            if self.corrupt_sectors.get(sector + i, 0) > 0:
+                self.corrupt_sectors[sector + i] -= 1
+                data[100] ^= 0x01
+            elif self.speed > self.weak_sectors.get(sector + i, commands.MAX_SPEED):
+                data[100] ^= 0x01
+            self.cache[slot * commands.RAW_SECTOR_SIZE:(slot + 1) * commands.RAW_SECTOR_SIZE] = data
+            copies.append(data)
+
+        for s in range(sector, sector + count):
+            if self.bad_sectors.get(s, 0) > 0:
+                self.bad_sectors[s] -= 1
+                return SENSE_MEDIUM_ERROR, delay
+        if self.error_rate > 0 and self.random.random() < self.error_rate:
+            return SENSE_MEDIUM_ERROR, delay
+
+        # the host gets descrambled user data (non streaming reads check the EDC)
+        for i in range(count):
+            data = copies[i] if i < len(copies) else bytearray(self.raw_sector(sector + i))
+            sector_view = raw.raw_sector(data)
+            seed = sector_view.recover_seed()
+            if seed is not None:
+                sector_view.descramble(seed)
+            elif not streaming:
+                return SENSE_MEDIUM_ERROR, delay
+            view[i * commands.SECTOR_SIZE:(i + 1) * commands.SECTOR_SIZE] = sector_view.data
+
+        return SENSE_OK, delay
+
+    def _read_memory(self, cmd, view):
+        if bytes(cmd[1:5]) != b"HIT\x01":
+            return SENSE_INVALID_FIELD, self.latency
+
+        offset = int.from_bytes(cmd[6:10], 'big') - commands.HITACHI_MEM_BASE
+        nbyte = int.from_bytes(cmd[10:12], 'big')
+        if offset < 0 or offset + nbyte > len(self.cache) or len(view) < nbyte:
+            return SENSE_INVALID_FIELD, self.latency
+
+        view[:nbyte] = self.cache[offset:offset + nbyte]
+        return SENSE_OK, self.latency + self._transfer_time(nbyte)